@@ -3,11 +3,13 @@ from import_export import resources
 from import_export.admin import ImportExportModelAdmin
 from api.models import (
     Tag,
+    Profile,
     Recipe,
     Ingredient,
     RecipeIngredient,
     Subscription,
     ShoppingCartItem,
+    ShoppingListIngredient,
     Favorite,
 )
 
@@ -25,6 +27,8 @@ class TagAdmin(admin.ModelAdmin):
 @admin.register(Recipe)
 class RecipeAdmin(admin.ModelAdmin):
     inlines = (RecipeIngredient, )
+    list_display = ('name', 'author', 'favorites_count', 'in_carts_count')
+    readonly_fields = ('favorites_count', 'in_carts_count')
 
 
 class IngredientResource(resources.ModelResource):
@@ -44,6 +48,12 @@ admin.site.register(Ingredient, IngredientAdmin)
 #     pass
 
 
+@admin.register(Profile)
+class ProfileAdmin(admin.ModelAdmin):
+    list_display = ('user', 'recipes_count')
+    readonly_fields = ('recipes_count', )
+
+
 @admin.register(Subscription)
 class SubscriptionAdmin(admin.ModelAdmin):
     pass
@@ -57,3 +67,8 @@ class ShoppingCartItemAdmin(admin.ModelAdmin):
 @admin.register(Favorite)
 class FavoriteAdmin(admin.ModelAdmin):
     pass
+
+
+@admin.register(ShoppingListIngredient)
+class ShoppingListIngredientAdmin(admin.ModelAdmin):
+    list_display = ('user', 'ingredient', 'amount', 'recipes')
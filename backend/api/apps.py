@@ -4,3 +4,18 @@ from django.apps import AppConfig
 class ApiConfig(AppConfig):
     default_auto_field = 'django.db.models.BigAutoField'
     name = 'api'
+
+    def ready(self):
+        from django.core.signals import request_finished, request_started
+        from django.db.backends.signals import connection_created
+
+        import api.signals  # noqa: F401
+        from api.db import (
+            check_connections,
+            install_query_wrappers,
+            mark_connections_used,
+        )
+
+        request_started.connect(check_connections)
+        request_finished.connect(mark_connections_used)
+        connection_created.connect(install_query_wrappers)
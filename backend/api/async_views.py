@@ -0,0 +1,58 @@
+import functools
+
+from asgiref.sync import sync_to_async
+from django.db import close_old_connections
+from django.http import HttpResponse
+
+from api.db import check_connections, mark_connections_used
+
+
+def database_sync_to_async(func):
+    """
+    Выполняет синхронный код с ORM в пуле потоков. Под ASGI Django 3.2
+    запускает синхронные представления в одном общем потоке
+    (thread_sensitive=True), и запросы выполняются по очереди.
+    Соединения потоков пула проверяются и закрываются по тем же
+    правилам, что и в запросах WSGI (CONN_MAX_AGE, DB_HEALTH_CHECK_IDLE).
+    """
+    @functools.wraps(func)
+    def inner(*args, **kwargs):
+        close_old_connections()
+        check_connections()
+        try:
+            return func(*args, **kwargs)
+        finally:
+            mark_connections_used()
+            close_old_connections()
+
+    return sync_to_async(inner, thread_sensitive=False)
+
+
+def async_view(view):
+    """
+    Асинхронное представление из представления DRF: запрос обрабатывается
+    и ответ готовится целиком в пуле потоков, а цикл событий тем временем
+    обслуживает другие запросы и отдаёт ответы медленным клиентам.
+    """
+    @database_sync_to_async
+    def get_response(request, *args, **kwargs):
+        response = view(request, *args, **kwargs)
+        if response.streaming:
+            # Django 3.2 читает потоковый ответ в цикле событий, где ORM
+            # недоступен, поэтому содержимое собирается здесь.
+            content = b''.join(response.streaming_content)
+        else:
+            if hasattr(response, 'render'):
+                response.render()
+            content = response.content
+        return HttpResponse(
+            content,
+            status=response.status_code,
+            headers=dict(response.items()),
+        )
+
+    @functools.wraps(view)
+    async def wrapper(request, *args, **kwargs):
+        return await get_response(request, *args, **kwargs)
+
+    return wrapper
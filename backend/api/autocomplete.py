@@ -0,0 +1,104 @@
+import bisect
+import itertools
+import threading
+
+from django.conf import settings
+from api.etags import get_data_version
+from api.models import Ingredient
+
+
+def normalize(value):
+    """Приводит строку к виду для поиска: регистр, ё -> е, пробелы."""
+    return ' '.join(value.casefold().replace('ё', 'е').split())
+
+
+def prefixed(entries, query):
+    """
+    Элементы отсортированного списка, ключ которых начинается с query.
+    """
+    start = bisect.bisect_left(entries, (query,))
+    for entry in itertools.islice(entries, start, None):
+        if not entry[0].startswith(query):
+            break
+        yield entry
+
+
+class IngredientIndex:
+    """
+    Индекс названий ингредиентов в памяти процесса для автодополнения.
+
+    Версия индекса — счётчик изменений ингредиентов в базе (DataVersion),
+    поэтому изменения видят все процессы gunicorn, а не только тот,
+    где они сделаны. При смене версии индекс перестраивается.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._version = None
+        self._names = []
+        self._words = []
+        self._items = {}
+
+    def get_version(self):
+        return get_data_version('ingredients')
+
+    def rebuild(self, version):
+        items = {}
+        names = []
+        words = []
+        for pk, name, measurement_unit in Ingredient.objects.values_list(
+            'id', 'name', 'measurement_unit'
+        ):
+            items[pk] = {
+                'id': pk,
+                'name': name,
+                'measurement_unit': measurement_unit,
+            }
+            key = normalize(name)
+            names.append((key, pk))
+            position = key.find(' ')
+            while position != -1:
+                words.append((key[position + 1:], key, pk))
+                position = key.find(' ', position + 1)
+        names.sort()
+        words.sort()
+        self._items, self._names, self._words = items, names, words
+        self._version = version
+
+    def search(self, query, limit=None, version=None):
+        """
+        Возвращает ингредиенты, упорядоченные по релевантности:
+        совпадение с началом названия, с началом слова, вхождение.
+        version — результат get_version, если он уже известен.
+        """
+        if limit is None:
+            limit = settings.INGREDIENT_SEARCH_LIMIT
+        if version is None:
+            version = self.get_version()
+        with self._lock:
+            if self._version != version:
+                self.rebuild(version)
+            names, words, items = self._names, self._words, self._items
+        query = normalize(query)
+        found = []
+        seen = set()
+
+        def collect(pks):
+            for pk in pks:
+                if len(found) >= limit:
+                    return
+                if pk not in seen:
+                    seen.add(pk)
+                    found.append(items[pk])
+
+        collect(pk for key, pk in prefixed(names, query))
+        if len(found) < limit:
+            collect(pk for key, pk in sorted(
+                (key, pk) for word, key, pk in prefixed(words, query)
+            ))
+        if len(found) < limit:
+            collect(pk for key, pk in names if query in key)
+        return found
+
+
+ingredient_index = IngredientIndex()
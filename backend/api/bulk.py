@@ -0,0 +1,297 @@
+import csv
+import json
+from io import StringIO
+from itertools import islice
+
+from django.contrib.auth import get_user_model
+from django.db import connection, transaction
+from django.db.models import Prefetch
+
+from api import cache
+from api.db import iterate
+from api.etags import bump_versions
+from api.models import Ingredient, Profile, Recipe, RecipeIngredient, Tag
+from api.search import update_search_vectors
+from api.utils import count_subquery
+
+User = get_user_model()
+
+
+def batched(items, size):
+    iterator = iter(items)
+    while True:
+        batch = list(islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
+def read_json(file, chunk_size=64 * 1024):
+    """
+    Читает JSON-массив объектов по одному элементу, не загружая
+    файл в память целиком.
+    """
+    decoder = json.JSONDecoder()
+    buffer = ''
+    eof = False
+    started = False
+    while True:
+        buffer = buffer.lstrip()
+        if not started and buffer:
+            if not buffer.startswith('['):
+                raise ValueError('Ожидался JSON-массив')
+            buffer = buffer[1:].lstrip()
+            started = True
+        if started and buffer.startswith(','):
+            buffer = buffer[1:].lstrip()
+        if started and buffer.startswith(']'):
+            return
+        try:
+            if not buffer:
+                raise ValueError
+            item, end = decoder.raw_decode(buffer)
+        except ValueError:
+            if eof:
+                raise ValueError('Неожиданный конец JSON-массива')
+            chunk = file.read(chunk_size)
+            eof = not chunk
+            buffer += chunk
+            continue
+        yield item
+        buffer = buffer[end:]
+
+
+def write_json(stream, items):
+    """
+    Пишет JSON-массив по одному элементу.
+    """
+    stream.write('[')
+    for number, item in enumerate(items):
+        if number:
+            stream.write(',')
+        stream.write('\n')
+        stream.write(json.dumps(item, ensure_ascii=False))
+    stream.write('\n]\n')
+
+
+def read_ingredients(file, file_format):
+    """
+    Пары (название, единица измерения) из CSV без заголовка
+    (как data/ingredients.csv) или JSON (как data/ingredients.json).
+    """
+    if file_format == 'csv':
+        for row in csv.reader(file):
+            if row:
+                yield row[0], row[1]
+    else:
+        for item in read_json(file):
+            yield item['name'], item['measurement_unit']
+
+
+def export_ingredients(batch_size):
+    return iterate(Ingredient.objects.order_by('id').values(
+        'name', 'measurement_unit'
+    ), batch_size)
+
+
+def copy_ingredients(batch):
+    """
+    Вставка через COPY во временную таблицу и INSERT ... ON CONFLICT:
+    на PostgreSQL это в разы быстрее многострочного INSERT.
+    """
+    buffer = StringIO()
+    csv.writer(buffer).writerows(batch)
+    buffer.seek(0)
+    table = Ingredient._meta.db_table
+    with transaction.atomic(), connection.cursor() as cursor:
+        cursor.execute(
+            'CREATE TEMPORARY TABLE ingredient_import '
+            '(name varchar(200), measurement_unit varchar(200)) '
+            'ON COMMIT DROP'
+        )
+        cursor.copy_expert(
+            'COPY ingredient_import FROM STDIN WITH (FORMAT csv)', buffer
+        )
+        cursor.execute(
+            f'INSERT INTO {table} (name, measurement_unit, updated_at) '
+            'SELECT DISTINCT name, measurement_unit, now() '
+            'FROM ingredient_import ON CONFLICT DO NOTHING'
+        )
+
+
+def import_ingredients(rows, batch_size, use_copy=True):
+    """
+    Добавляет ингредиенты пачками, пропуская уже существующие.
+    Для каждой пачки возвращает число прочитанных строк.
+    """
+    use_copy = use_copy and connection.vendor == 'postgresql'
+    for batch in batched(rows, batch_size):
+        if use_copy:
+            copy_ingredients(batch)
+        else:
+            Ingredient.objects.bulk_create(
+                [Ingredient(name=name, measurement_unit=measurement_unit)
+                 for name, measurement_unit in batch],
+                ignore_conflicts=True,
+            )
+        yield len(batch)
+    cache.invalidate('ingredients', 'recipes')
+    bump_versions('ingredients', 'recipes')
+
+
+def export_recipes(batch_size):
+    """
+    Рецепты с тегами, ингредиентами и именем файла изображения.
+    Выборка идёт пачками по id, чтобы prefetch работал без загрузки
+    всей таблицы.
+    """
+    last_id = 0
+    while True:
+        recipes = list(Recipe.objects.filter(
+            id__gt=last_id
+        ).order_by('id').select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )[:batch_size])
+        if not recipes:
+            return
+        last_id = recipes[-1].id
+        for recipe in recipes:
+            yield {
+                'author': recipe.author.username,
+                'name': recipe.name,
+                'text': recipe.text,
+                'cooking_time': recipe.cooking_time,
+                'image': recipe.image.name,
+                'tags': [tag.slug for tag in recipe.tags.all()],
+                'ingredients': [
+                    {
+                        'name': item.ingredient.name,
+                        'measurement_unit': item.ingredient.measurement_unit,
+                        'amount': item.amount,
+                    }
+                    for item in recipe.recipeingredient_set.all()
+                ],
+            }
+
+
+class RecipeImporter:
+    """
+    Импорт рецептов пачками. Рецепт считается уже загруженным, если
+    у автора есть рецепт с тем же названием, поэтому повторный импорт
+    ничего не дублирует. Недостающие ингредиенты создаются, рецепты
+    с неизвестным автором или тегом пропускаются.
+    """
+
+    def __init__(self):
+        self.tags = dict(Tag.objects.values_list('slug', 'id'))
+        self.ingredients = {}
+        self.skipped = 0
+
+    def resolve_ingredients(self, items):
+        keys = {
+            (item['name'], item['measurement_unit']) for item in items
+        } - self.ingredients.keys()
+        if not keys:
+            return
+        Ingredient.objects.bulk_create(
+            [Ingredient(name=name, measurement_unit=measurement_unit)
+             for name, measurement_unit in keys],
+            ignore_conflicts=True,
+        )
+        for pk, name, measurement_unit in Ingredient.objects.filter(
+            name__in={name for name, _ in keys}
+        ).values_list('id', 'name', 'measurement_unit'):
+            self.ingredients[name, measurement_unit] = pk
+
+    def import_batch(self, batch):
+        authors = dict(User.objects.filter(
+            username__in={item['author'] for item in batch}
+        ).values_list('username', 'id'))
+        existing = set(Recipe.objects.filter(
+            author_id__in=authors.values(),
+            name__in={item['name'] for item in batch},
+        ).values_list('author_id', 'name'))
+        new = {}
+        for item in batch:
+            author_id = authors.get(item['author'])
+            if author_id is None or any(
+                slug not in self.tags for slug in item['tags']
+            ):
+                self.skipped += 1
+                continue
+            key = author_id, item['name']
+            if key not in existing:
+                new[key] = item
+        if not new:
+            return 0
+        self.resolve_ingredients([
+            ingredient for item in new.values()
+            for ingredient in item['ingredients']
+        ])
+        recipes = Recipe.objects.bulk_create([
+            Recipe(
+                author_id=author_id,
+                name=name,
+                text=item['text'],
+                cooking_time=item['cooking_time'],
+                image=item['image'],
+            )
+            for (author_id, name), item in new.items()
+        ])
+        if recipes[0].pk is None:
+            # Не все СУБД возвращают id из bulk_create.
+            ids = {
+                (author_id, name): pk for pk, author_id, name in
+                Recipe.objects.filter(
+                    author_id__in={author_id for author_id, _ in new},
+                    name__in={name for _, name in new},
+                ).values_list('id', 'author_id', 'name')
+            }
+        else:
+            ids = {
+                (recipe.author_id, recipe.name): recipe.pk
+                for recipe in recipes
+            }
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe_id=ids[key], ingredient_id=ingredient_id, amount=amount
+            )
+            for key, item in new.items()
+            for ingredient_id, amount in {
+                self.ingredients[
+                    ingredient['name'], ingredient['measurement_unit']
+                ]: ingredient['amount']
+                for ingredient in item['ingredients']
+            }.items()
+        ])
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=ids[key], tag_id=self.tags[slug])
+            for key, item in new.items()
+            for slug in set(item['tags'])
+        ])
+        update_search_vectors(Recipe.objects.filter(pk__in=ids.values()))
+        author_ids = {author_id for author_id, _ in new}
+        Profile.objects.bulk_create(
+            [Profile(user_id=author_id) for author_id in author_ids],
+            ignore_conflicts=True,
+        )
+        Profile.objects.filter(user_id__in=author_ids).update(
+            recipes_count=count_subquery(Recipe, 'author', 'user')
+        )
+        return len(new)
+
+    def run(self, items, batch_size):
+        """
+        Для каждой пачки возвращает (прочитано, добавлено).
+        """
+        for batch in batched(items, batch_size):
+            with transaction.atomic():
+                inserted = self.import_batch(batch)
+            yield len(batch), inserted
+        # bulk_create не отправляет сигналы, поэтому кэш сбрасывается здесь.
+        cache.invalidate('ingredients', 'recipes')
+        bump_versions('ingredients', 'recipes')
@@ -0,0 +1,114 @@
+import hashlib
+import uuid
+from urllib.parse import urlencode
+
+from django.conf import settings
+from django.core.cache import cache
+from rest_framework.response import Response
+
+from api.metrics import count_cache
+
+KEY_PREFIX = 'response_cache'
+NAMESPACES = ('tags', 'ingredients', 'recipes')
+
+
+def version_key(namespace):
+    return f'{KEY_PREFIX}:version:{namespace}'
+
+
+def stats_key(namespace, result):
+    return f'{KEY_PREFIX}:{result}:{namespace}'
+
+
+def get_version(namespace):
+    version = cache.get(version_key(namespace))
+    if version is None:
+        cache.add(version_key(namespace), uuid.uuid4().hex, None)
+        version = cache.get(version_key(namespace))
+    return version
+
+
+def invalidate(*namespaces):
+    """
+    Сбрасывает закэшированные ответы: у пространства появляется новая
+    версия, а старые записи истекают по таймауту.
+    """
+    for namespace in namespaces:
+        cache.set(version_key(namespace), uuid.uuid4().hex, None)
+
+
+def normalized_path(request):
+    """
+    Путь запроса с отсортированными параметрами.
+    """
+    query = urlencode(sorted(
+        (name, value)
+        for name, values in request.query_params.lists()
+        for value in values
+    ))
+    return f'{request.path}?{query}'
+
+
+def response_key(namespace, request):
+    # ETag из ConditionalGetMixin привязывает запись к версии данных.
+    etag = getattr(request, 'etag', '')
+    digest = hashlib.md5(
+        f'{normalized_path(request)}|{etag}'.encode()
+    ).hexdigest()
+    return f'{KEY_PREFIX}:{namespace}:{get_version(namespace)}:{digest}'
+
+
+def count(namespace, result):
+    count_cache(namespace, result)
+    key = stats_key(namespace, result)
+    try:
+        cache.incr(key)
+    except ValueError:
+        if not cache.add(key, 1, None):
+            cache.incr(key)
+
+
+def get_stats():
+    """
+    Число попаданий и промахов кэша по пространствам.
+    """
+    values = cache.get_many([
+        stats_key(namespace, result)
+        for namespace in NAMESPACES
+        for result in ('hit', 'miss')
+    ])
+    return {
+        namespace: {
+            result: values.get(stats_key(namespace, result), 0)
+            for result in ('hit', 'miss')
+        }
+        for namespace in NAMESPACES
+    }
+
+
+class AnonymousCacheMixin:
+    """
+    Кэширует данные ответов list/retrieve для анонимных пользователей.
+    """
+    cache_namespace = None
+
+    def list(self, request, *args, **kwargs):
+        return self.cached(super().list, request, *args, **kwargs)
+
+    def retrieve(self, request, *args, **kwargs):
+        return self.cached(super().retrieve, request, *args, **kwargs)
+
+    def cached(self, handler, request, *args, **kwargs):
+        if not request.user.is_anonymous:
+            return handler(request, *args, **kwargs)
+        key = response_key(self.cache_namespace, request)
+        data = cache.get(key)
+        if data is not None:
+            count(self.cache_namespace, 'hit')
+            return Response(data, headers={'X-Cache': 'HIT'})
+        count(self.cache_namespace, 'miss')
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            cache.set(key, response.data, settings.RESPONSE_CACHE_TIMEOUT)
+        response['X-Cache'] = 'MISS'
+        return response
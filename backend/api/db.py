@@ -0,0 +1,85 @@
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from functools import partial
+
+from django.conf import settings
+from django.db import connections
+
+# Обёртки SQL-запросов текущего запроса к API (см. wrap_queries).
+query_wrappers = ContextVar('query_wrappers', default=())
+
+
+def check_connections(**kwargs):
+    """
+    Перед запросом проверяет постоянные соединения, простаивавшие
+    дольше DB_HEALTH_CHECK_IDLE секунд: соединение, закрытое сервером
+    или pgbouncer, закрывается заранее, а не падает на первом запросе.
+    """
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is None:
+            continue
+        idle = now - getattr(connection, 'last_used', now)
+        if idle >= settings.DB_HEALTH_CHECK_IDLE and (
+            not connection.is_usable()
+        ):
+            connection.close()
+
+
+def mark_connections_used(**kwargs):
+    now = time.monotonic()
+    for connection in connections.all():
+        if connection.connection is not None:
+            connection.last_used = now
+
+
+def run_query_wrappers(execute, sql, params, many, context):
+    for wrapper in reversed(query_wrappers.get()):
+        execute = partial(wrapper, execute)
+    return execute(sql, params, many, context)
+
+
+def install_query_wrappers(connection, **kwargs):
+    """
+    Подключает к соединению run_query_wrappers (сигнал connection_created).
+    """
+    if run_query_wrappers not in connection.execute_wrappers:
+        connection.execute_wrappers.append(run_query_wrappers)
+
+
+@contextmanager
+def wrap_queries(wrapper):
+    """
+    Как connection.execute_wrapper, но обёртка действует в контексте, а не
+    в потоке: под ASGI запросы к базе выполняются в потоках пула
+    (database_sync_to_async, синхронные представления), куда asgiref
+    копирует контекст корутины.
+    """
+    token = query_wrappers.set(query_wrappers.get() + (wrapper,))
+    try:
+        yield
+    finally:
+        query_wrappers.reset(token)
+
+
+def iterate(queryset, chunk_size):
+    """
+    Обходит выборку, не читая её в память целиком. Без серверных
+    курсоров (DISABLE_SERVER_SIDE_CURSORS в режиме pgbouncer) читает
+    частями по chunk_size строк: курсор не переживает транзакцию,
+    а соединение с сервером после неё может достаться другому клиенту.
+    Порядок выборки должен быть однозначным.
+    """
+    if not connections[queryset.db].settings_dict.get(
+        'DISABLE_SERVER_SIDE_CURSORS'
+    ):
+        yield from queryset.iterator(chunk_size=chunk_size)
+        return
+    offset = 0
+    while True:
+        chunk = list(queryset[offset:offset + chunk_size])
+        yield from chunk
+        if len(chunk) < chunk_size:
+            return
+        offset += chunk_size
@@ -0,0 +1,118 @@
+import hashlib
+
+from django.core.exceptions import ValidationError
+from django.db.models import Count, F, Max, OuterRef, Subquery
+from django.utils.cache import get_conditional_response
+from django.utils.http import http_date
+
+from api.cache import normalized_path
+from api.models import DataVersion, Favorite, ShoppingCartItem, Subscription
+
+RELATIONS = (
+    ('favorites', Favorite),
+    ('shopping_cart', ShoppingCartItem),
+    ('subscriptions', Subscription),
+)
+
+
+def get_data_version(name):
+    return DataVersion.objects.filter(name=name).values_list(
+        'version', flat=True
+    ).first()
+
+
+def bump_versions(*names):
+    """
+    Увеличивает счётчики изменений данных. Вызывается в той же
+    транзакции, что и изменение, рядом с обновлением updated_at.
+    """
+    updated = DataVersion.objects.filter(name__in=names).update(
+        version=F('version') + 1
+    )
+    if updated < len(names):
+        DataVersion.objects.bulk_create([
+            DataVersion(name=name, version=1) for name in names
+        ], ignore_conflicts=True)
+
+
+def relations_marker(user):
+    """
+    Состояние избранного, корзины и подписок пользователя одним запросом.
+    Пара (число, максимальный id) меняется при любом добавлении или
+    удалении.
+    """
+    annotations = {}
+    for name, model in RELATIONS:
+        relation = model.objects.filter(
+            user=OuterRef('pk')
+        ).order_by().values('user')
+        annotations[f'{name}_count'] = Subquery(
+            relation.annotate(value=Count('id')).values('value')
+        )
+        annotations[f'{name}_max'] = Subquery(
+            relation.annotate(value=Max('id')).values('value')
+        )
+    return type(user).objects.filter(pk=user.pk).annotate(
+        **annotations
+    ).values_list(*annotations).first()
+
+
+class ConditionalGetMixin:
+    """
+    ETag для list/retrieve: у списка — по счётчику изменений данных
+    (DataVersion с именем cache_namespace), у объекта — по полю
+    updated_at. Если данные не менялись, возвращается 304 без
+    сериализации и тяжёлых запросов. Last-Modified отдаётся только
+    для retrieve.
+    Для авторизованных пользователей ETag учитывает их избранное,
+    корзину и подписки, поэтому Last-Modified не отдаётся.
+    """
+    user_dependent = False
+
+    def get_validator_state(self):
+        # Версия всех данных, а не отфильтрованной выборки: один запрос
+        # по первичному ключу, фильтры не приходится применять дважды.
+        return (get_data_version(self.cache_namespace),)
+
+    def list(self, request, *args, **kwargs):
+        return self.conditional(
+            super().list, self.get_validator_state(),
+            request, *args, **kwargs
+        )
+
+    def retrieve(self, request, *args, **kwargs):
+        lookup = self.lookup_url_kwarg or self.lookup_field
+        try:
+            last_modified = self.queryset.filter(
+                **{self.lookup_field: kwargs[lookup]}
+            ).values_list('updated_at', flat=True).first()
+        except (ValueError, TypeError, ValidationError):
+            # Некорректный id: 404 вернёт get_object_or_404.
+            last_modified = None
+        if last_modified is None:
+            return super().retrieve(request, *args, **kwargs)
+        return self.conditional(
+            super().retrieve, (last_modified,), request, *args, **kwargs
+        )
+
+    def conditional(self, handler, state, request, *args, **kwargs):
+        last_modified = state[0] if self.action == 'retrieve' else None
+        if self.user_dependent and not request.user.is_anonymous:
+            state += (request.user.pk, relations_marker(request.user))
+            last_modified = None
+        etag = '"{}"'.format(hashlib.md5(
+            f'{normalized_path(request)}|{state}'.encode()
+        ).hexdigest())
+        timestamp = last_modified and int(last_modified.timestamp())
+        response = get_conditional_response(
+            request._request, etag=etag, last_modified=timestamp
+        )
+        if response is not None:
+            return response
+        request.etag = etag
+        response = handler(request, *args, **kwargs)
+        if response.status_code == 200:
+            response['ETag'] = etag
+            if timestamp:
+                response['Last-Modified'] = http_date(timestamp)
+        return response
@@ -1,5 +1,7 @@
+from django import forms
 from django_filters.rest_framework import FilterSet, filters
 from .models import Recipe, Tag, Ingredient
+from .search import search_recipes
 
 
 class IngredientFilter(FilterSet):
@@ -13,6 +15,10 @@ class IngredientFilter(FilterSet):
         fields = ['name']
 
 
+class IntegerInFilter(filters.BaseInFilter, filters.NumberFilter):
+    field_class = forms.IntegerField
+
+
 class RecipeFilter(FilterSet):
     tags = filters.ModelMultipleChoiceFilter(
         field_name='tags__slug',
@@ -29,10 +35,42 @@ class RecipeFilter(FilterSet):
         method='filter_is_in_shopping_cart',
         label='Is In Shopping Cart'
     )
+    since = filters.IsoDateTimeFilter(
+        field_name='updated_at',
+        lookup_expr='gte',
+        label='Changed Since'
+    )
+    until = filters.IsoDateTimeFilter(
+        field_name='updated_at',
+        lookup_expr='lt',
+        label='Changed Until'
+    )
+    search = filters.CharFilter(
+        method='filter_search',
+        label='Search'
+    )
+    ingredients = IntegerInFilter(
+        method='filter_ingredients',
+        label='Ingredients'
+    )
+    exclude_ingredients = IntegerInFilter(
+        method='filter_ingredients',
+        label='Exclude Ingredients'
+    )
+    min_coverage = filters.NumberFilter(
+        method='filter_min_coverage',
+        min_value=0,
+        max_value=1,
+        label='Min Coverage'
+    )
 
     class Meta:
         model = Recipe
-        fields = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+        fields = (
+            'author', 'tags', 'is_favorited', 'is_in_shopping_cart', 'search',
+            'ingredients', 'exclude_ingredients', 'min_coverage', 'since',
+            'until',
+        )
 
     def filter_is_favorited(self, queryset, name, value):
         user = self.request.user
@@ -45,3 +83,22 @@ class RecipeFilter(FilterSet):
         if value and not user.is_anonymous:
             return queryset.filter(added_to_shopping_cart_by__user=user)
         return queryset
+
+    def filter_search(self, queryset, name, value):
+        return search_recipes(queryset, value)
+
+    def filter_ingredients(self, queryset, name, value):
+        # Оба списка и min_coverage применяются вместе, один раз.
+        if name == 'exclude_ingredients' and self.form.cleaned_data.get(
+            'ingredients'
+        ):
+            return queryset
+        min_coverage = self.form.cleaned_data.get('min_coverage')
+        return queryset.by_ingredients(
+            include=self.form.cleaned_data.get('ingredients') or (),
+            exclude=self.form.cleaned_data.get('exclude_ingredients') or (),
+            min_coverage=1 if min_coverage is None else float(min_coverage),
+        )
+
+    def filter_min_coverage(self, queryset, name, value):
+        return queryset
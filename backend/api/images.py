@@ -0,0 +1,135 @@
+import logging
+import os
+from concurrent.futures import ThreadPoolExecutor
+from io import BytesIO
+
+from django.conf import settings
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.db import connections, transaction
+from django.utils import timezone
+from PIL import Image, ImageOps, features
+
+from api import cache
+from api.etags import bump_versions
+from api.models import Recipe
+
+logger = logging.getLogger(__name__)
+
+# Имя версии изображения: максимальные ширина и высота.
+RENDITIONS = {
+    'thumbnail': (300, 300),
+    'medium': (800, 800),
+    'full': (1600, 1600),
+}
+IMAGE_FIELDS = ['image'] + [f'image_{rendition}' for rendition in RENDITIONS]
+
+executor = None
+
+
+def get_executor():
+    global executor
+    if executor is None:
+        executor = ThreadPoolExecutor(
+            max_workers=settings.IMAGE_PROCESSING_WORKERS,
+            thread_name_prefix='recipe-images',
+        )
+    return executor
+
+
+def encode(image):
+    """
+    Кодирует изображение в WebP, а если Pillow собран без него — в JPEG.
+    Метаданные (EXIF) при пересохранении не переносятся.
+    """
+    buffer = BytesIO()
+    if features.check('webp'):
+        image.save(buffer, 'WEBP', quality=80, method=4)
+        return buffer.getvalue(), 'webp'
+    image.convert('RGB').save(buffer, 'JPEG', quality=85, optimize=True)
+    return buffer.getvalue(), 'jpg'
+
+
+def process_recipe_image(recipe_id):
+    """
+    Строит уменьшенные версии изображения рецепта.
+    """
+    recipe = Recipe.objects.filter(pk=recipe_id).first()
+    if recipe is None or not recipe.image:
+        return
+    original = recipe.image.name
+    with recipe.image.open('rb') as file:
+        image = ImageOps.exif_transpose(Image.open(file))
+        image.load()
+    if image.mode not in ('RGB', 'RGBA'):
+        image = image.convert('RGBA' if 'A' in image.getbands() else 'RGB')
+    base = os.path.splitext(os.path.basename(original))[0]
+    previous = [
+        getattr(recipe, f'image_{rendition}').name for rendition in RENDITIONS
+    ]
+    fields = {}
+    for rendition, size in RENDITIONS.items():
+        resized = image.copy()
+        resized.thumbnail(size, Image.LANCZOS)
+        content, extension = encode(resized)
+        field = getattr(recipe, f'image_{rendition}')
+        field.save(f'{base}_{rendition}.{extension}', ContentFile(content),
+                   save=False)
+        fields[f'image_{rendition}'] = field.name
+    # Если за время обработки загрузили новое изображение, результат
+    # относится к старому и не сохраняется.
+    if Recipe.objects.filter(pk=recipe_id, image=original).update(
+        updated_at=timezone.now(), **fields
+    ):
+        cache.invalidate('recipes')
+        bump_versions('recipes')
+        delete_files(previous)
+    else:
+        delete_files(fields.values())
+
+
+def recipe_files(recipe):
+    """
+    Имена всех файлов изображения рецепта в хранилище.
+    """
+    return [
+        getattr(recipe, field).name for field in IMAGE_FIELDS
+        if getattr(recipe, field)
+    ]
+
+
+def delete_files(names):
+    for name in names:
+        if name:
+            default_storage.delete(name)
+
+
+def run_task(task, *args):
+    try:
+        task(*args)
+    except Exception:
+        logger.exception('Ошибка фоновой задачи %s%s', task.__name__, args)
+    finally:
+        connections.close_all()
+
+
+def submit_on_commit(task, *args):
+    """
+    Запускает задачу в пуле потоков после коммита транзакции.
+    При IMAGE_PROCESSING_WORKERS = 0 задача выполняется в текущем потоке.
+    """
+    def submit():
+        if settings.IMAGE_PROCESSING_WORKERS:
+            get_executor().submit(run_task, task, *args)
+        else:
+            task(*args)
+
+    transaction.on_commit(submit)
+
+
+def schedule_image_processing(recipe):
+    submit_on_commit(process_recipe_image, recipe.pk)
+
+
+def schedule_file_deletion(names):
+    submit_on_commit(delete_files, list(names))
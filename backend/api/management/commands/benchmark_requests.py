@@ -0,0 +1,105 @@
+import threading
+import time
+from wsgiref.util import setup_testing_defaults
+
+from django.conf import settings
+from django.core.handlers.wsgi import WSGIHandler
+from django.core.management.base import BaseCommand
+from django.db import DEFAULT_DB_ALIAS, connections
+from django.test.utils import override_settings
+
+from api.profiling import percentile
+
+
+def start_response(status, headers, exc_info=None):
+    pass
+
+
+class Command(BaseCommand):
+    help = (
+        'Измеряет число запросов в секунду к эндпоинтам API через '
+        'WSGI-обработчик в этом процессе: сначала с новым соединением с БД '
+        'на каждый запрос (CONN_MAX_AGE=0), затем с CONN_MAX_AGE из '
+        'настроек. Запускать на базе, настроенной как в продакшене.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'paths',
+            nargs='*',
+            default=['/api/tags/'],
+            help='Пути эндпоинтов, по умолчанию /api/tags/.',
+        )
+        parser.add_argument(
+            '--requests',
+            type=int,
+            default=500,
+            help='Запросов на каждый путь в каждом потоке.',
+        )
+        parser.add_argument(
+            '--threads',
+            type=int,
+            default=4,
+            help='Число параллельных потоков, как потоков gunicorn.',
+        )
+
+    def worker(self, handler, paths, requests, latencies, errors):
+        try:
+            for path in paths:
+                path, _, query = path.partition('?')
+                for _ in range(requests):
+                    environ = {'PATH_INFO': path, 'QUERY_STRING': query}
+                    setup_testing_defaults(environ)
+                    started = time.perf_counter()
+                    response = handler(environ, start_response)
+                    b''.join(response)
+                    # close() отправляет request_finished: в этот момент
+                    # Django закрывает соединение при CONN_MAX_AGE=0.
+                    response.close()
+                    latencies.append(time.perf_counter() - started)
+                    if response.status_code >= 400:
+                        errors.append(response.status_code)
+        finally:
+            connections.close_all()
+
+    def run(self, conn_max_age, options):
+        database = settings.DATABASES[DEFAULT_DB_ALIAS]
+        previous = database['CONN_MAX_AGE']
+        database['CONN_MAX_AGE'] = conn_max_age
+        handler = WSGIHandler()
+        latencies, errors = [], []
+        threads = [
+            threading.Thread(target=self.worker, args=(
+                handler, options['paths'], options['requests'],
+                latencies, errors,
+            ))
+            for _ in range(options['threads'])
+        ]
+        started = time.perf_counter()
+        try:
+            for thread in threads:
+                thread.start()
+            for thread in threads:
+                thread.join()
+        finally:
+            database['CONN_MAX_AGE'] = previous
+        elapsed = time.perf_counter() - started
+        self.stdout.write(
+            f'CONN_MAX_AGE={conn_max_age}: '
+            f'{len(latencies) / elapsed:.0f} запросов/с, '
+            f'p50 {percentile(latencies, 0.5) * 1000:.1f} мс, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.1f} мс, '
+            f'ошибок: {len(errors)}'
+        )
+
+    def handle(self, *args, **options):
+        conn_max_age = settings.DATABASES[DEFAULT_DB_ALIAS]['CONN_MAX_AGE']
+        self.stdout.write(
+            f'{connections[DEFAULT_DB_ALIAS].vendor}, '
+            f'потоков: {options["threads"]}, '
+            f'запросов: {options["requests"]} на путь'
+        )
+        with override_settings(ALLOWED_HOSTS=['*']):
+            self.run(0, options)
+            if conn_max_age != 0:
+                self.run(conn_max_age, options)
@@ -0,0 +1,151 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import connection
+from django.db.models import Count
+from django.test.utils import CaptureQueriesContext, override_settings
+from rest_framework.test import APIClient
+
+from api.models import Ingredient, Recipe, Tag
+
+User = get_user_model()
+
+
+def sequential_scans(sql, params=None):
+    """
+    Таблицы, которые запрос читает полным просмотром, по плану
+    EXPLAIN (PostgreSQL) или EXPLAIN QUERY PLAN (SQLite).
+    """
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+            plans = [cursor.fetchone()[0][0]['Plan']]
+            tables = []
+            while plans:
+                plan = plans.pop()
+                if plan['Node Type'] == 'Seq Scan':
+                    tables.append(plan['Relation Name'])
+                plans.extend(plan.get('Plans', []))
+            return tables
+        # SQLite не отличает полный просмотр от чтения по rowid в порядке
+        # первичного ключа, поэтому результат на ней лишь ориентировочный.
+        cursor.execute(f'EXPLAIN QUERY PLAN {sql}', params)
+        tables = []
+        for *_, detail in cursor.fetchall():
+            words = detail.split()
+            # «SCAN [TABLE] name» без «USING ... INDEX» — полный просмотр.
+            if words[0] == 'SCAN' and 'USING' not in words:
+                tables.append(words[2] if words[1] == 'TABLE' else words[1])
+        return tables
+
+
+def table_size(table):
+    with connection.cursor() as cursor:
+        if connection.vendor == 'postgresql':
+            cursor.execute(
+                'SELECT reltuples FROM pg_class WHERE relname = %s', [table]
+            )
+            row = cursor.fetchone()
+            return int(row[0]) if row else 0
+        cursor.execute(
+            f'SELECT COUNT(*) FROM {connection.ops.quote_name(table)}'
+        )
+        return cursor.fetchone()[0]
+
+
+class Command(BaseCommand):
+    help = (
+        'Выполняет запросы основных эндпоинтов API, строит для каждого '
+        'SQL-запроса план и сообщает о полных просмотрах больших таблиц. '
+        'Запускать на базе с наполненными данными (см. import_data).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--user',
+            type=int,
+            help='id пользователя для запросов; по умолчанию тот, '
+                 'у кого больше всего избранного.',
+        )
+        parser.add_argument(
+            '--min-rows',
+            type=int,
+            default=1000,
+            help='Полный просмотр таблиц меньшего размера не считается '
+                 'проблемой.',
+        )
+
+    def get_endpoints(self, user):
+        recipe = Recipe.objects.order_by('-id').first()
+        tag = Tag.objects.first()
+        ingredient = Ingredient.objects.order_by('id').first()
+        endpoints = [
+            '/api/tags/',
+            '/api/recipes/',
+            '/api/recipes/?is_favorited=1',
+            '/api/recipes/?is_in_shopping_cart=1',
+            '/api/recipes/?pagination=cursor',
+            '/api/users/subscriptions/?recipes_limit=3',
+            '/api/recipes/download_shopping_cart/',
+        ]
+        if recipe is not None:
+            endpoints += [
+                f'/api/recipes/{recipe.id}/',
+                f'/api/recipes/?author={recipe.author_id}',
+            ]
+        if tag is not None:
+            endpoints.append(f'/api/recipes/?tags={tag.slug}')
+        if ingredient is not None:
+            endpoints += [
+                f'/api/ingredients/?name={ingredient.name[:3]}',
+                f'/api/recipes/?ingredients={ingredient.id}',
+            ]
+        return endpoints
+
+    def handle(self, *args, **options):
+        if options['user'] is not None:
+            user = User.objects.filter(pk=options['user']).first()
+        else:
+            user = User.objects.annotate(
+                favorites_count=Count('favorites')
+            ).order_by('-favorites_count', 'id').first()
+        if user is None:
+            raise CommandError('Нет пользователей для выполнения запросов')
+        client = APIClient()
+        client.force_authenticate(user)
+        # В плане встречаются и подзапросы, их пропускаем.
+        sizes = dict.fromkeys(connection.introspection.table_names())
+        problems = 0
+        for url in self.get_endpoints(user):
+            with override_settings(ALLOWED_HOSTS=['testserver']), \
+                    CaptureQueriesContext(connection) as context:
+                response = client.get(url)
+                if response.streaming:
+                    b''.join(response.streaming_content)
+            queries = [
+                query['sql'] for query in context.captured_queries
+                if query['sql'].lstrip().upper().startswith('SELECT')
+            ]
+            flagged = []
+            for sql in queries:
+                for table in sequential_scans(sql):
+                    if table not in sizes:
+                        continue
+                    if sizes[table] is None:
+                        sizes[table] = table_size(table)
+                    if sizes[table] >= options['min_rows']:
+                        flagged.append((table, sql))
+            status = self.style.ERROR('SEQ SCAN') if flagged else 'ok'
+            self.stdout.write(
+                f'{url}: {response.status_code}, запросов: {len(queries)}, '
+                f'{status}'
+            )
+            for table, sql in flagged:
+                self.stdout.write(f'    {table} ({sizes[table]} строк): {sql}')
+            problems += len(flagged)
+        if problems:
+            raise CommandError(
+                f'Полный просмотр больших таблиц в {problems} запросах'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            'Полных просмотров больших таблиц нет'
+        ))
@@ -0,0 +1,93 @@
+from datetime import timedelta
+
+from django.core.files.storage import default_storage
+from django.core.management.base import BaseCommand
+from django.db.models import Q
+from django.utils import timezone
+
+from api.images import IMAGE_FIELDS
+from api.models import ImageUpload, Recipe
+
+DIRECTORIES = ('recipes', 'recipes/renditions')
+
+
+class Command(BaseCommand):
+    help = (
+        'Удаляет из хранилища изображения, на которые не ссылаются рецепты '
+        'и незавершённые загрузки.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько файлов проверять одним запросом к БД.',
+        )
+        parser.add_argument(
+            '--min-age-hours',
+            type=float,
+            default=24,
+            help=(
+                'Не трогать файлы моложе указанного возраста: они могут '
+                'принадлежать загрузке, которая ещё не сохранена в БД.'
+            ),
+        )
+        parser.add_argument(
+            '--dry-run',
+            action='store_true',
+            help='Только показать, что будет удалено.',
+        )
+
+    def referenced(self, names):
+        query = Q()
+        for field in IMAGE_FIELDS:
+            query |= Q(**{f'{field}__in': names})
+        found = set()
+        for row in Recipe.objects.filter(query).values_list(*IMAGE_FIELDS):
+            found.update(row)
+        found.update(ImageUpload.objects.filter(
+            image__in=names
+        ).values_list('image', flat=True))
+        return found
+
+    def handle(self, *args, **options):
+        threshold = timezone.now() - timedelta(hours=options['min_age_hours'])
+        # Загрузки, токен которых так и не использовали, больше не
+        # удерживают свои файлы.
+        expired = ImageUpload.objects.filter(created__lt=threshold)
+        if options['dry_run']:
+            expired = expired.count()
+        else:
+            expired, _ = expired.delete()
+        batch_size = options['batch_size']
+        checked = removed = reclaimed = 0
+        for directory in DIRECTORIES:
+            if not default_storage.exists(directory):
+                continue
+            _, files = default_storage.listdir(directory)
+            names = [f'{directory}/{file}' for file in files]
+            checked += len(names)
+            for start in range(0, len(names), batch_size):
+                batch = names[start:start + batch_size]
+                referenced = self.referenced(batch)
+                for name in batch:
+                    if name in referenced:
+                        continue
+                    if default_storage.get_modified_time(name) > threshold:
+                        continue
+                    size = default_storage.size(name)
+                    if not options['dry_run']:
+                        # Повторная проверка непосредственно перед
+                        # удалением: файл мог появиться в рецепте.
+                        if self.referenced([name]):
+                            continue
+                        default_storage.delete(name)
+                    removed += 1
+                    reclaimed += size
+        action = 'Будет удалено' if options['dry_run'] else 'Удалено'
+        self.stdout.write(self.style.SUCCESS(
+            f'Проверено файлов: {checked}. {action}: {removed}, '
+            f'освобождено {reclaimed / 1024 / 1024:.1f} МБ. '
+            f'Просроченных загрузок: {expired}.'
+        ))
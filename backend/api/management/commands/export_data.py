@@ -0,0 +1,69 @@
+import csv
+import sys
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import export_ingredients, export_recipes, write_json
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково выгружает ингредиенты (CSV или JSON) или рецепты (JSON) '
+        'в файл или stdout. Результат можно загрузить командой import_data.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=('ingredients', 'recipes'))
+        parser.add_argument(
+            '--output',
+            help='Путь к файлу; по умолчанию stdout.',
+        )
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            default='json',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько записей читать из базы за один запрос.',
+        )
+
+    def counted(self, items):
+        started = time.monotonic()
+        number = 0
+        for number, item in enumerate(items, 1):
+            yield item
+            if number % 10000 == 0:
+                self.stderr.write(f'\rВыгружено: {number}', ending='')
+        self.exported = number
+        self.elapsed = time.monotonic() - started
+
+    def handle(self, *args, **options):
+        kind = options['kind']
+        if kind == 'recipes' and options['format'] != 'json':
+            raise CommandError('Рецепты выгружаются только в JSON')
+        if kind == 'ingredients':
+            items = export_ingredients(options['batch_size'])
+        else:
+            items = export_recipes(options['batch_size'])
+        stream = (
+            open(options['output'], 'w', encoding='utf-8', newline='')
+            if options['output'] else options.get('stdout') or sys.stdout
+        )
+        try:
+            if options['format'] == 'csv':
+                csv.writer(stream).writerows(
+                    (item['name'], item['measurement_unit'])
+                    for item in self.counted(items)
+                )
+            else:
+                write_json(stream, self.counted(items))
+        finally:
+            if options['output']:
+                stream.close()
+        self.stderr.write(self.style.SUCCESS(
+            f'\rВыгружено: {self.exported} за {self.elapsed:.1f} с'
+        ))
@@ -0,0 +1,89 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from api.bulk import (
+    RecipeImporter,
+    import_ingredients,
+    read_ingredients,
+    read_json,
+)
+from api.models import Ingredient
+
+
+class Command(BaseCommand):
+    help = (
+        'Потоково загружает ингредиенты (CSV или JSON) или рецепты (JSON, '
+        'формат export_data) пачками. Уже загруженные записи пропускаются, '
+        'поэтому команду можно запускать повторно.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument('kind', choices=('ingredients', 'recipes'))
+        parser.add_argument('path', help='Путь к файлу.')
+        parser.add_argument(
+            '--format',
+            choices=('csv', 'json'),
+            help='Формат файла; по умолчанию определяется по расширению.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=1000,
+            help='Сколько записей вставлять за один проход.',
+        )
+        parser.add_argument(
+            '--no-copy',
+            action='store_true',
+            help='Не использовать COPY на PostgreSQL.',
+        )
+
+    def progress(self, read, started):
+        elapsed = time.monotonic() - started
+        self.stderr.write(
+            f'\rПрочитано: {read} ({read / max(elapsed, 1e-6):.0f} в секунду)',
+            ending='',
+        )
+
+    def handle(self, *args, **options):
+        file_format = options['format'] or options['path'].rpartition('.')[2]
+        if file_format not in ('csv', 'json'):
+            raise CommandError('Укажите --format csv или --format json')
+        if options['kind'] == 'recipes' and file_format != 'json':
+            raise CommandError('Рецепты загружаются только из JSON')
+        started = time.monotonic()
+        read = inserted = skipped = 0
+        with open(options['path'], encoding='utf-8', newline='') as file:
+            try:
+                if options['kind'] == 'ingredients':
+                    before = Ingredient.objects.count()
+                    for count in import_ingredients(
+                        read_ingredients(file, file_format),
+                        options['batch_size'],
+                        use_copy=not options['no_copy'],
+                    ):
+                        read += count
+                        self.progress(read, started)
+                    inserted = Ingredient.objects.count() - before
+                else:
+                    importer = RecipeImporter()
+                    for count, added in importer.run(
+                        read_json(file), options['batch_size']
+                    ):
+                        read += count
+                        inserted += added
+                        self.progress(read, started)
+                    skipped = importer.skipped
+            except (ValueError, KeyError, IndexError) as error:
+                raise CommandError(f'Некорректные данные: {error!r}')
+        self.stderr.write('')
+        elapsed = time.monotonic() - started
+        message = f'Прочитано: {read}, добавлено: {inserted}'
+        if skipped:
+            message += (
+                f', пропущено из-за неизвестных авторов или тегов: {skipped}'
+            )
+        self.stdout.write(self.style.SUCCESS(
+            f'{message}. {elapsed:.1f} с, '
+            f'{read / max(elapsed, 1e-6):.0f} записей в секунду.'
+        ))
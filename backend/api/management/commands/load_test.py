@@ -0,0 +1,144 @@
+import asyncio
+import time
+from urllib.parse import urlsplit
+
+from django.core.management.base import BaseCommand
+
+from api.profiling import percentile
+
+
+class Command(BaseCommand):
+    help = (
+        'Нагрузочный тест запущенного сервера: быстрые клиенты в цикле '
+        'запрашивают URL, пока медленные клиенты по байту передают '
+        'заголовки своих запросов и занимают соединения. Сравнивает '
+        'режимы SERVER_MODE=wsgi и SERVER_MODE=asgi.'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            'url',
+            help='URL эндпоинта, например http://127.0.0.1:8000/api/tags/.',
+        )
+        parser.add_argument(
+            '--clients',
+            type=int,
+            default=10,
+            help='Число быстрых клиентов.',
+        )
+        parser.add_argument(
+            '--slow-clients',
+            type=int,
+            default=0,
+            help='Число медленных клиентов.',
+        )
+        parser.add_argument(
+            '--slow-seconds',
+            type=float,
+            default=5,
+            help='За сколько секунд медленный клиент передаёт запрос.',
+        )
+        parser.add_argument(
+            '--duration',
+            type=float,
+            default=10,
+            help='Длительность теста, сек.',
+        )
+        parser.add_argument(
+            '--token',
+            help='Токен для заголовка Authorization.',
+        )
+
+    def request(self, url, token):
+        parts = urlsplit(url)
+        path = parts.path or '/'
+        if parts.query:
+            path = f'{path}?{parts.query}'
+        headers = [
+            f'GET {path} HTTP/1.1',
+            f'Host: {parts.netloc}',
+            'Connection: close',
+        ]
+        if token:
+            headers.append(f'Authorization: Token {token}')
+        return ('\r\n'.join(headers) + '\r\n\r\n').encode()
+
+    async def send(self, host, port, request, delay=0):
+        reader, writer = await asyncio.open_connection(host, port)
+        try:
+            if delay:
+                for byte in range(len(request)):
+                    writer.write(request[byte:byte + 1])
+                    await writer.drain()
+                    await asyncio.sleep(delay)
+            else:
+                writer.write(request)
+            status = (await reader.readline()).split(b' ', 2)[1]
+            await reader.read()
+            return int(status)
+        finally:
+            writer.close()
+
+    async def fast_client(self, host, port, request, deadline, results):
+        while time.monotonic() < deadline:
+            started = time.monotonic()
+            try:
+                status = await asyncio.wait_for(
+                    self.send(host, port, request),
+                    max(deadline - started, 0.1)
+                )
+            except (OSError, IndexError, ValueError, asyncio.TimeoutError):
+                status = None
+            results.append((time.monotonic() - started, status))
+
+    async def slow_client(self, host, port, request, deadline, delay):
+        while time.monotonic() < deadline:
+            try:
+                await self.send(host, port, request, delay)
+            except (OSError, IndexError, ValueError):
+                await asyncio.sleep(delay)
+
+    async def run(self, options):
+        parts = urlsplit(options['url'])
+        host, port = parts.hostname, parts.port or 80
+        request = self.request(options['url'], options['token'])
+        deadline = time.monotonic() + options['duration']
+        delay = options['slow_seconds'] / len(request)
+        results = []
+        slow = [
+            asyncio.ensure_future(
+                self.slow_client(host, port, request, deadline, delay)
+            )
+            for _ in range(options['slow_clients'])
+        ]
+        # Медленные клиенты успевают занять соединения до начала замера.
+        await asyncio.sleep(0.5 if slow else 0)
+        started = time.monotonic()
+        await asyncio.gather(*(
+            self.fast_client(host, port, request, deadline, results)
+            for _ in range(options['clients'])
+        ))
+        elapsed = time.monotonic() - started
+        for task in slow:
+            task.cancel()
+        await asyncio.gather(*slow, return_exceptions=True)
+        return results, elapsed
+
+    def handle(self, *args, **options):
+        results, elapsed = asyncio.run(self.run(options))
+        latencies = [
+            latency for latency, status in results
+            if status is not None and status < 400
+        ]
+        errors = len(results) - len(latencies)
+        if not latencies:
+            self.stdout.write(f'Нет успешных запросов, ошибок: {errors}')
+            return
+        self.stdout.write(
+            f'{len(latencies) / elapsed:.0f} запросов/с, '
+            f'p50 {percentile(latencies, 0.5) * 1000:.1f} мс, '
+            f'p95 {percentile(latencies, 0.95) * 1000:.1f} мс, '
+            f'ошибок: {errors} '
+            f'(быстрых клиентов: {options["clients"]}, '
+            f'медленных: {options["slow_clients"]})'
+        )
@@ -0,0 +1,52 @@
+from django.core.management.base import BaseCommand
+
+from api.profiling import get_report, reset
+
+
+class Command(BaseCommand):
+    help = (
+        'Показывает p50/p95/p99 времени, SQL-запросов, сериализации и '
+        'размера ответа по маршрутам API (нужен PROFILING_ENABLED).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--reset',
+            action='store_true',
+            help='Очистить накопленные замеры.',
+        )
+        parser.add_argument(
+            '--duplicates',
+            type=int,
+            default=3,
+            help='Сколько самых частых повторяющихся SQL показывать.',
+        )
+
+    def handle(self, *args, **options):
+        if options['reset']:
+            reset()
+            self.stdout.write(self.style.SUCCESS('Замеры очищены'))
+            return
+        report = get_report()
+        if not report:
+            self.stdout.write('Замеров нет')
+            return
+        self.stdout.write(
+            f'{"маршрут":<48}{"n":>6}{"всего, мс":>22}{"SQL, мс":>22}'
+            f'{"запросы":>14}{"повторы":>14}{"сериализация, мс":>22}'
+            f'{"размер, Б":>22}'
+        )
+        # Сначала самые медленные маршруты по p95.
+        for route, stats in sorted(
+            report.items(), key=lambda item: -item[1]['total'][1]
+        ):
+            columns = ''.join(
+                f'{"/".join(f"{value:.0f}" for value in stats[metric]):>{width}}'
+                for metric, width in (
+                    ('total', 22), ('sql', 22), ('queries', 14),
+                    ('duplicates', 14), ('serializer', 22), ('size', 22),
+                )
+            )
+            self.stdout.write(f'{route:<48}{stats["count"]:>6}{columns}')
+            for count, sql in stats['duplicates_sql'][:options['duplicates']]:
+                self.stdout.write(f'    повторов {count}: {sql[:200]}')
@@ -0,0 +1,79 @@
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+
+from api.models import ShoppingCartItem, ShoppingListIngredient
+from api.utils import calculate_shopping_lists
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает списки покупок пользователей по их корзинам '
+        'или проверяет их (--check).'
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            '--check',
+            action='store_true',
+            help='Только проверить, ничего не изменяя.',
+        )
+        parser.add_argument(
+            '--batch-size',
+            type=int,
+            default=500,
+            help='Сколько пользователей обрабатывать за один проход.',
+        )
+
+    def handle(self, *args, **options):
+        user_ids = sorted(
+            set(ShoppingCartItem.objects.values_list('user_id', flat=True))
+            | set(ShoppingListIngredient.objects.values_list(
+                'user_id', flat=True
+            ))
+        )
+        batch_size = options['batch_size']
+        broken_users = 0
+        for start in range(0, len(user_ids), batch_size):
+            batch = user_ids[start:start + batch_size]
+            with transaction.atomic():
+                expected = calculate_shopping_lists(batch)
+                actual = {
+                    (user_id, ingredient_id): (amount, recipes)
+                    for user_id, ingredient_id, amount, recipes in
+                    ShoppingListIngredient.objects.filter(
+                        user_id__in=batch
+                    ).values_list('user_id', 'ingredient_id', 'amount',
+                                  'recipes')
+                }
+                broken = {
+                    user_id for user_id, ingredient_id in
+                    expected.keys() | actual.keys()
+                    if expected.get((user_id, ingredient_id))
+                    != actual.get((user_id, ingredient_id))
+                }
+                broken_users += len(broken)
+                if options['check'] or not broken:
+                    continue
+                ShoppingListIngredient.objects.filter(
+                    user_id__in=broken
+                ).delete()
+                ShoppingListIngredient.objects.bulk_create([
+                    ShoppingListIngredient(
+                        user_id=user_id,
+                        ingredient_id=ingredient_id,
+                        amount=amount,
+                        recipes=recipes,
+                    )
+                    for (user_id, ingredient_id), (amount, recipes)
+                    in expected.items() if user_id in broken
+                ])
+        if options['check'] and broken_users:
+            raise CommandError(
+                f'Списки покупок расходятся с корзинами у {broken_users} '
+                f'из {len(user_ids)} пользователей'
+            )
+        action = 'Проверено' if options['check'] else 'Исправлено'
+        self.stdout.write(self.style.SUCCESS(
+            f'{action}: {len(user_ids)} пользователей, '
+            f'расхождений: {broken_users}'
+        ))
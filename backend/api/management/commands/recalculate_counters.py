@@ -0,0 +1,16 @@
+from django.core.management.base import BaseCommand
+
+from api.utils import recalculate_counters
+
+
+class Command(BaseCommand):
+    help = (
+        'Пересчитывает счётчики рецептов авторов, избранного и списков '
+        'покупок.'
+    )
+
+    def handle(self, *args, **options):
+        profiles, recipes = recalculate_counters()
+        self.stdout.write(self.style.SUCCESS(
+            f'Пересчитано профилей: {profiles}, рецептов: {recipes}'
+        ))
@@ -0,0 +1,153 @@
+import asyncio
+import os
+import time
+
+from django.conf import settings
+from django.core.exceptions import MiddlewareNotUsed
+from django.http import Http404, HttpResponse
+from prometheus_client import (
+    CONTENT_TYPE_LATEST,
+    REGISTRY,
+    CollectorRegistry,
+    Counter,
+    Histogram,
+    generate_latest,
+    multiprocess,
+)
+
+from api.db import wrap_queries
+
+# В режиме нескольких процессов (gunicorn) значения пишутся в файлы
+# каталога PROMETHEUS_MULTIPROC_DIR и суммируются при выдаче /metrics.
+MULTIPROCESS = bool(os.getenv('PROMETHEUS_MULTIPROC_DIR'))
+
+REQUESTS = Counter(
+    'foodgram_http_requests_total',
+    'Запросы к API.',
+    ('view', 'method', 'status'),
+)
+LATENCY = Histogram(
+    'foodgram_http_request_duration_seconds',
+    'Время обработки запроса.',
+    ('view', 'method'),
+)
+QUERIES = Histogram(
+    'foodgram_db_queries_per_request',
+    'Число SQL-запросов на один запрос к API.',
+    ('view',),
+    buckets=(0, 1, 2, 3, 5, 8, 13, 21, 34, 55, 100),
+)
+QUERY_LATENCY = Histogram(
+    'foodgram_db_query_duration_seconds',
+    'Время выполнения SQL-запроса.',
+    ('view',),
+    buckets=(0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1),
+)
+CACHE = Counter(
+    'foodgram_response_cache_requests_total',
+    'Обращения к кэшу ответов для анонимных пользователей.',
+    ('namespace', 'result'),
+)
+UPLOADS = Histogram(
+    'foodgram_image_upload_bytes',
+    'Размер загруженных изображений.',
+    ('source',),
+    buckets=tuple(2 ** power * 1024 for power in range(4, 15, 2)),
+)
+
+
+def view_label(request):
+    """
+    Класс представления и действие ViewSet, например RecipeViewSet.list.
+    """
+    match = getattr(request, 'resolver_match', None)
+    if match is None:
+        return 'unmatched'
+    view = getattr(match.func, 'cls', match.func)
+    label = view.__name__
+    actions = getattr(match.func, 'actions', None)
+    if actions:
+        action = actions.get(request.method.lower())
+        if action is not None:
+            label = f'{label}.{action}'
+    return label
+
+
+def count_cache(namespace, result):
+    CACHE.labels(namespace, result).inc()
+
+
+def observe_upload(source, size):
+    UPLOADS.labels(source).observe(size)
+
+
+class QueryTimer:
+    def __init__(self):
+        self.durations = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.durations.append(time.perf_counter() - started)
+
+
+class MetricsMiddleware:
+    """
+    Считает запросы, время ответа и SQL-запросы по представлениям.
+    Работает и под WSGI, и под ASGI. Включается настройкой METRICS_ENABLED.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.METRICS_ENABLED:
+            raise MiddlewareNotUsed
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with wrap_queries(timer):
+            response = self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, timer)
+        return response
+
+    async def __acall__(self, request):
+        timer = QueryTimer()
+        started = time.perf_counter()
+        with wrap_queries(timer):
+            response = await self.get_response(request)
+        self.observe(request, response, time.perf_counter() - started, timer)
+        return response
+
+    def observe(self, request, response, elapsed, timer):
+        view = view_label(request)
+        method = request.method
+        REQUESTS.labels(view, method, response.status_code).inc()
+        LATENCY.labels(view, method).observe(elapsed)
+        QUERIES.labels(view).observe(len(timer.durations))
+        query_latency = QUERY_LATENCY.labels(view)
+        for duration in timer.durations:
+            query_latency.observe(duration)
+
+
+def metrics_view(request):
+    """
+    Метрики в текстовом формате Prometheus.
+    """
+    if not settings.METRICS_ENABLED:
+        raise Http404
+    if MULTIPROCESS:
+        registry = CollectorRegistry()
+        multiprocess.MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    return HttpResponse(
+        generate_latest(registry), content_type=CONTENT_TYPE_LATEST
+    )
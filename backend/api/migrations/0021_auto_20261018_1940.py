@@ -0,0 +1,57 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:40
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def fill_shopping_lists(apps, schema_editor):
+    ShoppingCartItem = apps.get_model('api', 'ShoppingCartItem')
+    ShoppingListIngredient = apps.get_model('api', 'ShoppingListIngredient')
+    rows = ShoppingCartItem.objects.filter(
+        recipe__recipeingredient__isnull=False,
+    ).values(
+        'user_id', 'recipe__recipeingredient__ingredient_id'
+    ).annotate(
+        amount=models.Sum('recipe__recipeingredient__amount'),
+        recipes=models.Count('recipe_id'),
+    ).order_by()
+    ShoppingListIngredient.objects.bulk_create(
+        [ShoppingListIngredient(
+            user_id=row['user_id'],
+            ingredient_id=row['recipe__recipeingredient__ingredient_id'],
+            amount=row['amount'],
+            recipes=row['recipes'],
+        ) for row in rows.iterator()],
+        batch_size=1000
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ('api', '0020_auto_20230819_2311'),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name='ShoppingListIngredient',
+            fields=[
+                ('id', models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name='ID')),
+                ('amount', models.PositiveIntegerField(default=0, verbose_name='Количество')),
+                ('recipes', models.PositiveIntegerField(default=0, verbose_name='Число рецептов')),
+                ('ingredient', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, to='api.ingredient', verbose_name='Ингредиент')),
+                ('user', models.ForeignKey(on_delete=django.db.models.deletion.CASCADE, related_name='shopping_list', to=settings.AUTH_USER_MODEL, verbose_name='Пользователь')),
+            ],
+            options={
+                'verbose_name': 'Ингредиент списка покупок',
+                'verbose_name_plural': 'Ингредиенты списка покупок',
+            },
+        ),
+        migrations.AddConstraint(
+            model_name='shoppinglistingredient',
+            constraint=models.UniqueConstraint(fields=('user', 'ingredient'), name='unique_shopping_list_ingredient'),
+        ),
+        migrations.RunPython(fill_shopping_lists, migrations.RunPython.noop),
+    ]
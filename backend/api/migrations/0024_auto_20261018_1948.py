@@ -0,0 +1,28 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:48
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0023_auto_20261018_2015'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='image_full',
+            field=models.ImageField(blank=True, upload_to='recipes/renditions', verbose_name='Полное изображение'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_medium',
+            field=models.ImageField(blank=True, upload_to='recipes/renditions', verbose_name='Среднее изображение'),
+        ),
+        migrations.AddField(
+            model_name='recipe',
+            name='image_thumbnail',
+            field=models.ImageField(blank=True, upload_to='recipes/renditions', verbose_name='Миниатюра'),
+        ),
+    ]
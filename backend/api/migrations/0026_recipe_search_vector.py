@@ -0,0 +1,47 @@
+# Generated by Django 3.2.3 on 2026-10-18 19:56
+
+import django.contrib.postgres.search
+from django.db import migrations
+
+# Полнотекстовый поиск есть только на PostgreSQL, на других СУБД
+# поле остаётся пустым.
+CREATE_INDEX = """
+CREATE INDEX api_recipe_search_vector_gin
+    ON api_recipe USING gin (search_vector);
+UPDATE api_recipe AS recipe SET search_vector =
+    setweight(to_tsvector('russian', coalesce(recipe.name, '')), 'A')
+    || setweight(to_tsvector('russian', coalesce(recipe.text, '')), 'B')
+    || setweight(to_tsvector('russian', coalesce((
+        SELECT string_agg(ingredient.name, ' ')
+        FROM api_recipeingredient AS item
+        JOIN api_ingredient AS ingredient ON ingredient.id = item.ingredient_id
+        WHERE item.recipe_id = recipe.id
+    ), '')), 'C');
+"""
+DROP_INDEX = 'DROP INDEX IF EXISTS api_recipe_search_vector_gin;'
+
+
+def create_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0025_imageupload'),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name='recipe',
+            name='search_vector',
+            field=django.contrib.postgres.search.SearchVectorField(editable=False, null=True, verbose_name='Поисковый документ'),
+        ),
+        migrations.RunPython(create_index, drop_index),
+    ]
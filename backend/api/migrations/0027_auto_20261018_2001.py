@@ -0,0 +1,62 @@
+# Generated by Django 3.2.3 on 2026-10-18 20:01
+
+from django.db import migrations, models
+import django.db.models.deletion
+
+# IngredientFilter (name__istartswith) на PostgreSQL превращается
+# в UPPER(name) LIKE UPPER('abc%'): нужен индекс по выражению.
+CREATE_INDEX = (
+    'CREATE INDEX ingredient_name_upper_like '
+    'ON api_ingredient (UPPER(name) text_pattern_ops);'
+)
+DROP_INDEX = 'DROP INDEX IF EXISTS ingredient_name_upper_like;'
+
+
+def create_upper_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(CREATE_INDEX)
+
+
+def drop_upper_name_index(apps, schema_editor):
+    if schema_editor.connection.vendor == 'postgresql':
+        schema_editor.execute(DROP_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ('api', '0026_recipe_search_vector'),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name='imageupload',
+            index=models.Index(fields=['created'], name='image_upload_created'),
+        ),
+        migrations.AddIndex(
+            model_name='ingredient',
+            index=models.Index(fields=['name'], name='ingredient_name_like', opclasses=['varchar_pattern_ops']),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['author', '-id'], name='recipe_author_id_desc'),
+        ),
+        migrations.AddIndex(
+            model_name='recipe',
+            index=models.Index(fields=['updated_at'], name='recipe_updated_at'),
+        ),
+        migrations.AddIndex(
+            model_name='recipeingredient',
+            index=models.Index(fields=['recipe', 'ingredient', 'amount'], name='recipe_ingredient_amount'),
+        ),
+        migrations.AddIndex(
+            model_name='subscription',
+            index=models.Index(fields=['user', '-id'], name='subscription_user_id_desc'),
+        ),
+        migrations.AlterField(
+            model_name='recipeingredient',
+            name='recipe',
+            field=models.ForeignKey(db_index=False, on_delete=django.db.models.deletion.CASCADE, to='api.recipe'),
+        ),
+        migrations.RunPython(create_upper_name_index, drop_upper_name_index),
+    ]
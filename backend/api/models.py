@@ -1,6 +1,19 @@
+import math
+import uuid
+
 from django.db import models
 from django.contrib.auth import get_user_model
-from django.db.models import UniqueConstraint
+from django.contrib.postgres.search import SearchVectorField
+from django.db.models import (
+    Count,
+    Exists,
+    OuterRef,
+    Prefetch,
+    Subquery,
+    UniqueConstraint,
+    Value,
+)
+from django.db.models.functions import Cast
 
 User = get_user_model()
 
@@ -23,6 +36,10 @@ class Tag(models.Model):
         default='#008000',
         max_length=7,
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
 
     class Meta:
         verbose_name = 'Тэг'
@@ -45,16 +62,100 @@ class Ingredient(models.Model):
         verbose_name='Единицы измерения',
         max_length=200
     )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
 
     class Meta:
         unique_together = ('name', 'measurement_unit')
         verbose_name = 'Ингредиент'
         verbose_name_plural = 'Ингредиенты'
+        indexes = [
+            # Поиск по началу названия (LIKE 'abc%') при любой локали БД.
+            models.Index(
+                fields=['name'],
+                name='ingredient_name_like',
+                opclasses=['varchar_pattern_ops'],
+            ),
+        ]
 
     def __str__(self):
         return f'{self.name}, {self.measurement_unit}.'
 
 
+class Profile(models.Model):
+    """
+    Модель со счётчиками пользователя
+    """
+    user = models.OneToOneField(
+        User,
+        on_delete=models.CASCADE,
+        related_name='profile',
+        verbose_name='Пользователь',
+    )
+    recipes_count = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Профиль'
+        verbose_name_plural = 'Профили'
+
+    def __str__(self):
+        return f'Профиль {self.user}'
+
+
+class RecipeQuerySet(models.QuerySet):
+    """
+    QuerySet рецептов с подготовкой данных для чтения.
+    """
+
+    def for_read(self):
+        """
+        Подгружает связанные объекты за фиксированное число запросов.
+        Флаги пользователя берутся из api.relations.Relations.
+        """
+        return self.select_related('author').prefetch_related(
+            'tags',
+            Prefetch(
+                'recipeingredient_set',
+                queryset=RecipeIngredient.objects.select_related('ingredient')
+            ),
+        )
+
+    def by_ingredients(self, include=(), exclude=(), min_coverage=1):
+        """
+        Рецепты, в которых есть не меньше min_coverage (доля от 0 до 1)
+        ингредиентов из include и нет ни одного из exclude.
+        В поле coverage — доля найденных ингредиентов из include,
+        рецепты упорядочены по ней.
+        """
+        queryset = self
+        if exclude:
+            queryset = queryset.filter(~Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient_id__in=exclude
+            )))
+        include = set(include)
+        if not include:
+            return queryset
+        required = max(1, math.ceil(len(include) * min_coverage - 1e-9))
+        matches = RecipeIngredient.objects.filter(ingredient_id__in=include)
+        # Группировка по индексу (ingredient, recipe) отбирает рецепты,
+        # подзапрос считает покрытие только для них.
+        return queryset.filter(pk__in=matches.values('recipe').annotate(
+            matched=Count('pk')
+        ).filter(matched__gte=required).values('recipe')).annotate(
+            coverage=Cast(Subquery(
+                matches.filter(recipe=OuterRef('pk')).order_by().values(
+                    'recipe'
+                ).annotate(matched=Count('pk')).values('matched')
+            ), models.FloatField())
+            / Value(len(include), output_field=models.FloatField())
+        ).order_by('-coverage', '-id')
+
+
 class Recipe(models.Model):
     """
     Модель для рецептов.
@@ -71,6 +172,21 @@ class Recipe(models.Model):
     text = models.TextField()
     cooking_time = models.PositiveSmallIntegerField()
     image = models.ImageField(upload_to='recipes')
+    image_thumbnail = models.ImageField(
+        verbose_name='Миниатюра',
+        upload_to='recipes/renditions',
+        blank=True,
+    )
+    image_medium = models.ImageField(
+        verbose_name='Среднее изображение',
+        upload_to='recipes/renditions',
+        blank=True,
+    )
+    image_full = models.ImageField(
+        verbose_name='Полное изображение',
+        upload_to='recipes/renditions',
+        blank=True,
+    )
     tags = models.ManyToManyField(
         Tag,
         related_name='recipes',
@@ -83,14 +199,84 @@ class Recipe(models.Model):
         through_fields=('recipe', 'ingredient')
     )
 
+    favorites_count = models.PositiveIntegerField(
+        verbose_name='В избранном',
+        default=0,
+    )
+    in_carts_count = models.PositiveIntegerField(
+        verbose_name='В списках покупок',
+        default=0,
+    )
+    pub_date = models.DateTimeField(
+        verbose_name='Дата публикации',
+        auto_now_add=True,
+    )
+    updated_at = models.DateTimeField(
+        verbose_name='Дата изменения',
+        auto_now=True,
+    )
+    search_vector = SearchVectorField(
+        verbose_name='Поисковый документ',
+        null=True,
+        editable=False,
+    )
+
+    objects = RecipeQuerySet.as_manager()
+
     class Meta:
         verbose_name = 'Рецепт'
         verbose_name_plural = 'Рецепты'
+        ordering = ('-pub_date', '-id')
+        indexes = [
+            # Лента и рецепты автора от новых к старым без сортировки.
+            models.Index(
+                fields=['-pub_date', '-id'], name='recipe_pub_date_desc'
+            ),
+            models.Index(
+                fields=['author', '-pub_date', '-id'],
+                name='recipe_author_pub_date_desc'
+            ),
+            # Фильтр since по updated_at.
+            models.Index(fields=['updated_at'], name='recipe_updated_at'),
+        ]
 
     def __str__(self):
         return self.name
 
 
+class ImageUpload(models.Model):
+    """
+    Модель загруженного изображения, ещё не привязанного к рецепту
+    """
+    token = models.UUIDField(
+        verbose_name='Токен',
+        default=uuid.uuid4,
+        unique=True,
+        editable=False,
+    )
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='image_uploads',
+        verbose_name='Пользователь',
+    )
+    image = models.ImageField(upload_to='recipes')
+    created = models.DateTimeField(
+        verbose_name='Дата загрузки',
+        auto_now_add=True,
+    )
+
+    class Meta:
+        verbose_name = 'Загруженное изображение'
+        verbose_name_plural = 'Загруженные изображения'
+        indexes = [
+            models.Index(fields=['created'], name='image_upload_created'),
+        ]
+
+    def __str__(self):
+        return f'{self.image} ({self.user})'
+
+
 class RecipeIngredient(models.Model):
     """
     Модель для реализации отношения ManyToMany ingredient_id -- recipe_id
@@ -103,6 +289,8 @@ class RecipeIngredient(models.Model):
     recipe = models.ForeignKey(
         Recipe,
         on_delete=models.CASCADE,
+        # Индекс по recipe заменяет recipe_ingredient_amount.
+        db_index=False,
     )
     amount = models.PositiveIntegerField(
         verbose_name='Количество',
@@ -116,6 +304,14 @@ class RecipeIngredient(models.Model):
             models.UniqueConstraint(fields=['ingredient', 'recipe'],
                                     name='unique_ingredient_recipe')
         ]
+        indexes = [
+            # Состав рецептов (prefetch, списки покупок) читается
+            # только из индекса, без обращения к таблице.
+            models.Index(
+                fields=['recipe', 'ingredient', 'amount'],
+                name='recipe_ingredient_amount',
+            ),
+        ]
 
     def __str__(self):
         return f'{self.ingredient} {self.amount}'
@@ -189,6 +385,47 @@ class ShoppingCartItem(models.Model):
         return f'Рецепт {self.recipe} в списке покупок {self.user}'
 
 
+class ShoppingListIngredient(models.Model):
+    """
+    Модель суммарного количества ингредиента в списке покупок пользователя
+    """
+    user = models.ForeignKey(
+        User,
+        on_delete=models.CASCADE,
+        related_name='shopping_list',
+        verbose_name='Пользователь',
+    )
+    ingredient = models.ForeignKey(
+        Ingredient,
+        on_delete=models.CASCADE,
+        verbose_name='Ингредиент',
+    )
+    amount = models.PositiveIntegerField(
+        verbose_name='Количество',
+        default=0,
+    )
+    recipes = models.PositiveIntegerField(
+        verbose_name='Число рецептов',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Ингредиент списка покупок'
+        verbose_name_plural = 'Ингредиенты списка покупок'
+        constraints = [
+            models.UniqueConstraint(
+                fields=(
+                    'user',
+                    'ingredient',
+                ),
+                name='unique_shopping_list_ingredient'
+            )
+        ]
+
+    def __str__(self):
+        return f'{self.ingredient} {self.amount} в списке покупок {self.user}'
+
+
 class Subscription(models.Model):
     """
     Модель подписки на авторов рецептов
@@ -214,8 +451,38 @@ class Subscription(models.Model):
                 name='unique_subscription'
             )
         ]
+        indexes = [
+            # Подписки пользователя от новых к старым (в том числе
+            # пагинация по курсору).
+            models.Index(
+                fields=['user', '-id'], name='subscription_user_id_desc'
+            ),
+        ]
         verbose_name = 'Подписка'
         verbose_name_plural = 'Подписки'
 
     def __str__(self):
         return (f'{self.user.username} подписан на {self.author.username}')
+
+
+class DataVersion(models.Model):
+    """
+    Модель счётчика изменений данных (тегов, ингредиентов, рецептов)
+    для ETag списков
+    """
+    name = models.CharField(
+        verbose_name='Данные',
+        max_length=32,
+        primary_key=True,
+    )
+    version = models.PositiveBigIntegerField(
+        verbose_name='Версия',
+        default=0,
+    )
+
+    class Meta:
+        verbose_name = 'Версия данных'
+        verbose_name_plural = 'Версии данных'
+
+    def __str__(self):
+        return f'{self.name}: {self.version}'
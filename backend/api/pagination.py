@@ -1,6 +1,225 @@
-from rest_framework.pagination import PageNumberPagination
+import hashlib
+from collections import OrderedDict
+from functools import partial
+
+from django.conf import settings
+from django.core.cache import cache
+from django.core.paginator import (
+    EmptyPage,
+    Page,
+    PageNotAnInteger,
+    Paginator,
+)
+from django.db import connections
+from django.utils.functional import cached_property
+from rest_framework.exceptions import NotFound, ValidationError
+from rest_framework.pagination import CursorPagination, PageNumberPagination
+from rest_framework.response import Response
+from rest_framework.utils.urls import remove_query_param, replace_query_param
+
+from api.cache import get_version
+
+
+def planner_estimate(queryset):
+    """
+    Оценка числа строк выборки планировщиком PostgreSQL (EXPLAIN без
+    выполнения запроса) или None на других СУБД.
+    """
+    connection = connections[queryset.db]
+    if connection.vendor != 'postgresql':
+        return None
+    sql, params = queryset.query.sql_with_params()
+    with connection.cursor() as cursor:
+        cursor.execute(f'EXPLAIN (FORMAT JSON) {sql}', params)
+        return cursor.fetchone()[0][0]['Plan']['Plan Rows']
+
+
+class EstimatedPage(Page):
+    """
+    Страница при приблизительном count: следующая страница есть, если
+    удалось прочитать лишнюю строку, а не по числу страниц.
+    """
+
+    def __init__(self, object_list, number, paginator, more):
+        super().__init__(object_list, number, paginator)
+        self.more = more
+
+    def has_next(self):
+        return self.more
+
+    def next_page_number(self):
+        return self.number + 1
+
+    def previous_page_number(self):
+        return self.number - 1
+
+
+class EstimatedCountPaginator(Paginator):
+    """
+    Paginator, который для больших выборок не выполняет COUNT(*):
+    выше PAGINATION_ESTIMATE_THRESHOLD count берётся из оценки
+    планировщика PostgreSQL, а на других СУБД — из кэша точного
+    значения на PAGINATION_COUNT_CACHE_TIMEOUT секунд. Ключ кэша —
+    SQL выборки и версия пространства кэша ответов, если она задана.
+    Приблизительный count только отдаётся в ответе: страницы по нему
+    не ограничиваются, иначе при заниженной оценке часть строк
+    стала бы недоступна.
+    """
+
+    def __init__(self, *args, namespace=None, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.namespace = namespace
+        self.estimated = False
+
+    def cache_key(self):
+        sql, params = self.object_list.query.sql_with_params()
+        digest = hashlib.md5(f'{sql}|{params}'.encode()).hexdigest()
+        version = get_version(self.namespace) if self.namespace else ''
+        return f'pagination_count:{version}:{digest}'
+
+    @cached_property
+    def count(self):
+        threshold = settings.PAGINATION_ESTIMATE_THRESHOLD
+        estimate = planner_estimate(self.object_list)
+        if estimate is not None:
+            if estimate >= threshold:
+                self.estimated = True
+                return estimate
+            return super().count
+        key = self.cache_key()
+        count = cache.get(key)
+        if count is not None:
+            self.estimated = True
+            return count
+        count = super().count
+        if count >= threshold:
+            cache.set(key, count, settings.PAGINATION_COUNT_CACHE_TIMEOUT)
+        return count
+
+    def validate_number(self, number):
+        if not (self.count and self.estimated):
+            return super().validate_number(number)
+        try:
+            number = int(number)
+        except (TypeError, ValueError):
+            raise PageNotAnInteger('Номер страницы должен быть целым числом')
+        if number < 1:
+            raise EmptyPage('Номер страницы меньше 1')
+        return number
+
+    def page(self, number):
+        number = self.validate_number(number)
+        if not self.estimated:
+            return super().page(number)
+        bottom = (number - 1) * self.per_page
+        rows = list(self.object_list[bottom:bottom + self.per_page + 1])
+        if not rows and number > 1:
+            raise EmptyPage('На странице нет объектов')
+        return EstimatedPage(
+            rows[:self.per_page], number, self, len(rows) > self.per_page
+        )
+
+
+class LimitCursorPagination(CursorPagination):
+    """
+    Пагинация по курсору: страница выбирается условием по полям
+    сортировки, а не OFFSET, и без подсчёта всех строк.
+    """
+    page_size_query_param = 'limit'
+    max_page_size = 100
+
+    def __init__(self, ordering):
+        self.ordering = ordering
 
 
 class LimitPageNumberPagination(PageNumberPagination):
+    """
+    Постраничная пагинация с параметром limit.
+
+    Для представлений с атрибутом cursor_ordering параметр
+    pagination=cursor (или переданный cursor) включает пагинацию
+    по курсору. Курсор строится по cursor_ordering, поэтому выборка,
+    которую фильтры упорядочили иначе (по релевантности поиска, по
+    покрытию ингредиентов), с ним не листается: ответ 400.
+    Параметр count=false отключает подсчёт общего числа объектов:
+    count в ответе будет null. Для больших выборок count
+    приблизительный (см. EstimatedCountPaginator), тогда в ответе есть
+    count_estimated: true.
+    """
     page_size_query_param = 'limit'
     max_page_size = 100
+    mode_query_param = 'pagination'
+    count_query_param = 'count'
+
+    @property
+    def django_paginator_class(self):
+        return partial(EstimatedCountPaginator, namespace=self.namespace)
+
+    def paginate_queryset(self, queryset, request, view=None):
+        self.cursor_pagination = None
+        self.counted = True
+        self.namespace = getattr(view, 'cache_namespace', None)
+        ordering = getattr(view, 'cursor_ordering', None)
+        params = request.query_params
+        if ordering and (
+            params.get(self.mode_query_param) == 'cursor'
+            or LimitCursorPagination.cursor_query_param in params
+        ):
+            if tuple(queryset.query.order_by) != tuple(ordering):
+                raise ValidationError({self.mode_query_param: (
+                    'Пагинация по курсору недоступна для выборки, '
+                    'упорядоченной по релевантности'
+                )})
+            self.cursor_pagination = LimitCursorPagination(ordering)
+            return self.cursor_pagination.paginate_queryset(
+                queryset, request, view
+            )
+        if params.get(self.count_query_param, '').lower() in ('0', 'false'):
+            self.counted = False
+            return self.paginate_without_count(queryset, request)
+        return super().paginate_queryset(queryset, request, view)
+
+    def paginate_without_count(self, queryset, request):
+        """
+        Страница по OFFSET без COUNT(*): следующая страница есть,
+        если удалось прочитать лишнюю строку.
+        """
+        page_size = self.get_page_size(request)
+        try:
+            number = int(request.query_params.get(self.page_query_param, 1))
+        except ValueError:
+            number = 0
+        if number < 1:
+            raise NotFound(self.invalid_page_message.format(
+                page_number=request.query_params.get(self.page_query_param),
+                message='Неверный номер страницы'
+            ))
+        offset = (number - 1) * page_size
+        rows = list(queryset[offset:offset + page_size + 1])
+        self.request = request
+        self.number = number
+        self.has_next = len(rows) > page_size
+        return rows[:page_size]
+
+    def get_paginated_response(self, data):
+        if self.cursor_pagination is not None:
+            return self.cursor_pagination.get_paginated_response(data)
+        if self.counted:
+            response = super().get_paginated_response(data)
+            if self.page.paginator.estimated:
+                response.data['count_estimated'] = True
+            return response
+        return Response(OrderedDict([
+            ('count', None),
+            ('next', self.get_uncounted_link(self.number + 1)
+             if self.has_next else None),
+            ('previous', self.get_uncounted_link(self.number - 1)
+             if self.number > 1 else None),
+            ('results', data),
+        ]))
+
+    def get_uncounted_link(self, number):
+        url = self.request.build_absolute_uri()
+        if number == 1:
+            return remove_query_param(url, self.page_query_param)
+        return replace_query_param(url, self.page_query_param, number)
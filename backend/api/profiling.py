@@ -0,0 +1,224 @@
+import asyncio
+import hashlib
+import math
+import time
+from contextvars import ContextVar
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.core.cache import cache
+from django.core.exceptions import MiddlewareNotUsed
+from rest_framework.serializers import BaseSerializer
+
+from api.db import wrap_queries
+
+KEY_PREFIX = 'profiling'
+ROUTES_KEY = f'{KEY_PREFIX}:routes'
+METRICS = ('total', 'sql', 'queries', 'duplicates', 'serializer', 'size')
+
+current = ContextVar('profile', default=None)
+
+
+class Profile:
+    """
+    Измерения одного запроса.
+    """
+
+    def __init__(self):
+        self.queries = 0
+        self.sql_time = 0.0
+        self.serializer_time = 0.0
+        self.serializer_depth = 0
+        self.fingerprints = {}
+
+    def __call__(self, execute, sql, params, many, context):
+        # Обёртка SQL-запросов (wrap_queries): время и отпечаток запроса.
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.sql_time += time.perf_counter() - started
+            self.queries += 1
+            fingerprint = hashlib.md5(sql.encode()).hexdigest()[:12]
+            count, _ = self.fingerprints.get(fingerprint, (0, sql))
+            self.fingerprints[fingerprint] = (count + 1, sql)
+
+    @property
+    def duplicates(self):
+        """
+        Сколько запросов повторили уже выполненный шаблон SQL:
+        признак N+1.
+        """
+        return sum(count - 1 for count, _ in self.fingerprints.values())
+
+    def duplicated(self):
+        return {
+            fingerprint: (count, sql)
+            for fingerprint, (count, sql) in self.fingerprints.items()
+            if count > 1
+        }
+
+
+def timed_data(data):
+    """
+    Учитывает время BaseSerializer.data во внешнем вызове: вложенные
+    сериализаторы не считаются повторно.
+    """
+    def wrapper(serializer):
+        profile = current.get()
+        if profile is None:
+            return data.fget(serializer)
+        profile.serializer_depth += 1
+        started = time.perf_counter()
+        try:
+            return data.fget(serializer)
+        finally:
+            profile.serializer_depth -= 1
+            if not profile.serializer_depth:
+                profile.serializer_time += time.perf_counter() - started
+
+    return property(wrapper)
+
+
+def install_serializer_timer():
+    if not getattr(BaseSerializer.data.fget, 'profiled', False):
+        BaseSerializer.data = timed_data(BaseSerializer.data)
+        BaseSerializer.data.fget.profiled = True
+
+
+def route_digest(route):
+    # В названии маршрута есть пробел, недопустимый в ключах memcached.
+    return hashlib.md5(route.encode()).hexdigest()
+
+
+def route_key(route):
+    return f'{KEY_PREFIX}:samples:{route_digest(route)}'
+
+
+def duplicates_key(route):
+    return f'{KEY_PREFIX}:duplicates:{route_digest(route)}'
+
+
+def record(route, sample, duplicated):
+    """
+    Добавляет замер в скользящее окно маршрута (последние
+    PROFILING_WINDOW запросов) и суммирует повторы шаблонов SQL.
+    """
+    key = route_key(route)
+    samples = cache.get(key) or []
+    samples.append(sample)
+    cache.set(key, samples[-settings.PROFILING_WINDOW:], None)
+    if duplicated:
+        key = duplicates_key(route)
+        totals = cache.get(key) or {}
+        for fingerprint, (count, sql) in duplicated.items():
+            total, _ = totals.get(fingerprint, (0, sql))
+            totals[fingerprint] = (total + count - 1, sql)
+        cache.set(key, totals, None)
+    routes = cache.get(ROUTES_KEY) or set()
+    if route not in routes:
+        cache.set(ROUTES_KEY, routes | {route}, None)
+
+
+def percentile(values, share):
+    values = sorted(values)
+    return values[max(0, math.ceil(share * len(values)) - 1)]
+
+
+def get_report():
+    """
+    {маршрут: {'count': n, метрика: (p50, p95, p99),
+    'duplicates_sql': [(число повторов, SQL), ...]}}.
+    """
+    report = {}
+    for route in sorted(cache.get(ROUTES_KEY) or ()):
+        samples = cache.get(route_key(route))
+        if not samples:
+            continue
+        report[route] = {'count': len(samples)}
+        for position, metric in enumerate(METRICS):
+            values = [sample[position] for sample in samples]
+            report[route][metric] = tuple(
+                percentile(values, share) for share in (0.5, 0.95, 0.99)
+            )
+        report[route]['duplicates_sql'] = sorted(
+            (cache.get(duplicates_key(route)) or {}).values(), reverse=True
+        )
+    return report
+
+
+def reset():
+    routes = cache.get(ROUTES_KEY) or ()
+    cache.delete_many(
+        [route_key(route) for route in routes]
+        + [duplicates_key(route) for route in routes]
+        + [ROUTES_KEY]
+    )
+
+
+class ProfilingMiddleware:
+    """
+    Измеряет число и время SQL-запросов, повторяющиеся запросы, время
+    сериализации и размер ответа. Отдаёт их в заголовке Server-Timing
+    и копит по маршрутам для команды profiling_report.
+    Работает и под WSGI, и под ASGI. Включается настройкой
+    PROFILING_ENABLED.
+    """
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        if not settings.PROFILING_ENABLED:
+            raise MiddlewareNotUsed
+        install_serializer_timer()
+        self.get_response = get_response
+        if asyncio.iscoroutinefunction(get_response):
+            self._is_coroutine = asyncio.coroutines._is_coroutine
+
+    def __call__(self, request):
+        if asyncio.iscoroutinefunction(self.get_response):
+            return self.__acall__(request)
+        profile = Profile()
+        token = current.set(profile)
+        started = time.perf_counter()
+        try:
+            with wrap_queries(profile):
+                response = self.get_response(request)
+        finally:
+            current.reset(token)
+        return self.finish(request, response, started, profile)
+
+    async def __acall__(self, request):
+        profile = Profile()
+        token = current.set(profile)
+        started = time.perf_counter()
+        try:
+            with wrap_queries(profile):
+                response = await self.get_response(request)
+        finally:
+            current.reset(token)
+        # Кэш с замерами — сетевой ввод-вывод, он не должен занимать
+        # цикл событий.
+        return await sync_to_async(self.finish, thread_sensitive=False)(
+            request, response, started, profile
+        )
+
+    def finish(self, request, response, started, profile):
+        total = (time.perf_counter() - started) * 1000
+        sql = profile.sql_time * 1000
+        serializer = profile.serializer_time * 1000
+        size = 0 if response.streaming else len(response.content)
+        response['Server-Timing'] = ', '.join([
+            f'total;dur={total:.1f}',
+            f'sql;dur={sql:.1f};desc="{profile.queries} queries, '
+            f'{profile.duplicates} duplicates"',
+            f'serializer;dur={serializer:.1f}',
+        ])
+        match = request.resolver_match
+        if match is not None:
+            route = f'{request.method} {match.view_name or match.route}'
+            record(route, (
+                total, sql, profile.queries, profile.duplicates,
+                serializer, size,
+            ), profile.duplicated())
+        return response
@@ -0,0 +1,72 @@
+from django.db.models import CharField, Value
+from rest_framework import serializers
+
+from api.models import Favorite, ShoppingCartItem, Subscription
+
+# Вид связи: модель и поле с id объекта.
+SOURCES = {
+    'favorites': (Favorite, 'recipe_id'),
+    'shopping_cart': (ShoppingCartItem, 'recipe_id'),
+    'subscriptions': (Subscription, 'author_id'),
+}
+
+
+class Relations:
+    """
+    Избранное, список покупок и подписки текущего пользователя на время
+    запроса. Id объектов страницы сначала регистрируются через add, при
+    первом обращении все они проверяются одним запросом (UNION ALL).
+    """
+
+    def __init__(self, user):
+        self.user = user
+        self.known = {kind: {} for kind in SOURCES}
+        self.pending = {kind: set() for kind in SOURCES}
+
+    def add(self, kind, ids):
+        self.pending[kind].update(ids)
+
+    def load(self):
+        missing = {}
+        querysets = []
+        for kind, (model, field) in SOURCES.items():
+            missing[kind] = self.pending[kind] - self.known[kind].keys()
+            self.pending[kind] = set()
+            if missing[kind] and not self.user.is_anonymous:
+                querysets.append(model.objects.filter(
+                    user=self.user, **{f'{field}__in': missing[kind]}
+                ).annotate(
+                    kind=Value(kind, output_field=CharField())
+                ).values_list('kind', field).order_by())
+        found = set()
+        if querysets:
+            found.update(querysets[0].union(*querysets[1:], all=True))
+        for kind, ids in missing.items():
+            self.known[kind].update((pk, (kind, pk) in found) for pk in ids)
+
+    def has(self, kind, pk):
+        if pk not in self.known[kind]:
+            self.add(kind, [pk])
+            self.load()
+        return self.known[kind][pk]
+
+
+def get_relations(request):
+    relations = getattr(request, 'relations', None)
+    if relations is None:
+        relations = request.relations = Relations(request.user)
+    return relations
+
+
+class RelationsListSerializer(serializers.ListSerializer):
+    """
+    Перед сериализацией списка передаёт его объекты в Relations
+    (метод add_relations дочернего сериализатора).
+    """
+
+    def to_representation(self, data):
+        items = list(data.all() if hasattr(data, 'all') else data)
+        self.child.add_relations(
+            get_relations(self.context['request']), items
+        )
+        return [self.child.to_representation(item) for item in items]
@@ -0,0 +1,101 @@
+from django.contrib.postgres.aggregates import StringAgg
+from django.contrib.postgres.search import (
+    SearchQuery,
+    SearchRank,
+    SearchVector,
+)
+from django.db import connection, transaction
+from django.db.models import (
+    Case,
+    Exists,
+    F,
+    IntegerField,
+    OuterRef,
+    Q,
+    Subquery,
+    Value,
+    When,
+)
+
+from api.models import Recipe, RecipeIngredient
+
+SEARCH_CONFIG = 'russian'
+
+
+def is_supported():
+    return connection.vendor == 'postgresql'
+
+
+def search_vector():
+    """
+    Документ рецепта: название важнее описания, описание важнее
+    названий ингредиентов.
+    """
+    ingredients = Subquery(
+        RecipeIngredient.objects.filter(
+            recipe=OuterRef('pk')
+        ).order_by().values('recipe').annotate(
+            names=StringAgg('ingredient__name', ' ')
+        ).values('names')
+    )
+    return (
+        SearchVector('name', weight='A', config=SEARCH_CONFIG)
+        + SearchVector('text', weight='B', config=SEARCH_CONFIG)
+        + SearchVector(ingredients, weight='C', config=SEARCH_CONFIG)
+    )
+
+
+def update_search_vectors(queryset):
+    """
+    Пересчитывает поисковые документы рецептов одним UPDATE.
+    На СУБД без полнотекстового поиска ничего не делает.
+    """
+    if is_supported():
+        queryset.update(search_vector=search_vector())
+
+
+def schedule_search_update(recipe_ids):
+    """
+    Пересчёт после коммита: к этому моменту ингредиенты рецепта,
+    добавленные после сохранения самого рецепта, уже записаны.
+    """
+    if not is_supported():
+        return
+    recipe_ids = list(recipe_ids)
+    transaction.on_commit(lambda: update_search_vectors(
+        Recipe.objects.filter(pk__in=recipe_ids)
+    ))
+
+
+def search_recipes(queryset, value):
+    """
+    Рецепты, подходящие под запрос, от наиболее релевантных.
+    На PostgreSQL — полнотекстовый поиск по search_vector, иначе
+    упрощённый поиск подстрок (для тестов на SQLite).
+    """
+    if is_supported():
+        query = SearchQuery(
+            value, config=SEARCH_CONFIG, search_type='websearch'
+        )
+        return queryset.filter(search_vector=query).annotate(
+            rank=SearchRank(F('search_vector'), query)
+        ).order_by('-rank', '-id')
+    words = value.split()
+    if not words:
+        return queryset
+    for word in words:
+        queryset = queryset.filter(
+            Exists(RecipeIngredient.objects.filter(
+                recipe=OuterRef('pk'), ingredient__name__icontains=word
+            ))
+            | Q(name__icontains=word)
+            | Q(text__icontains=word)
+        )
+    return queryset.annotate(
+        rank=Case(
+            When(name__icontains=words[0], then=Value(2)),
+            When(text__icontains=words[0], then=Value(1)),
+            default=Value(0),
+            output_field=IntegerField(),
+        )
+    ).order_by('-rank', '-id')
@@ -1,10 +1,20 @@
 from rest_framework import serializers
 from rest_framework.fields import SerializerMethodField
 from django.contrib.auth import get_user_model
+from django.db import transaction
 from djoser.serializers import UserCreateSerializer
 from drf_extra_fields.fields import Base64ImageField
 
-from api.models import Tag, Recipe, RecipeIngredient, Ingredient
+from api.images import (
+    IMAGE_FIELDS,
+    recipe_files,
+    schedule_file_deletion,
+    schedule_image_processing,
+)
+from api.metrics import observe_upload
+from api.models import Tag, Recipe, RecipeIngredient, Ingredient, ImageUpload
+from api.relations import RelationsListSerializer, get_relations
+from api.utils import change_recipe_in_shopping_lists
 
 User = get_user_model()
 
@@ -14,6 +24,23 @@ BASE_USER_FIELDS = [
 ]
 
 
+def get_recipes_limit(request):
+    recipes_limit = request.query_params.get('recipes_limit')
+    if recipes_limit is None:
+        return None
+    try:
+        recipes_limit = int(recipes_limit)
+    except ValueError:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Должно быть целым числом'}
+        )
+    if recipes_limit < 0:
+        raise serializers.ValidationError(
+            {'recipes_limit': 'Не может быть отрицательным'}
+        )
+    return recipes_limit
+
+
 class UserSerializer(serializers.ModelSerializer):
     """Сериализатор для предоставления данных о пользователе"""
     is_subscribed = SerializerMethodField(read_only=True)
@@ -21,17 +48,22 @@ class UserSerializer(serializers.ModelSerializer):
     class Meta:
         model = User
         fields = BASE_USER_FIELDS + ['is_subscribed']
+        list_serializer_class = RelationsListSerializer
 
     def validate_username(self, value):
         if value.lower() == 'me':
             raise serializers.ValidationError("Выберете другой логин")
         return value
 
+    def add_relations(self, relations, users):
+        relations.add('subscriptions', [user.id for user in users])
+
     def get_is_subscribed(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user.subscriptions.filter(author=obj).exists()
+        if hasattr(obj, 'is_subscribed'):
+            return obj.is_subscribed
+        return get_relations(self.context['request']).has(
+            'subscriptions', obj.id
+        )
 
 
 class UserCreateSerializer(UserCreateSerializer):
@@ -45,14 +77,14 @@ class TagSerializer(serializers.ModelSerializer):
     """Сериализатор для представления данных о тегах"""
     class Meta:
         model = Tag
-        fields = '__all__'
+        fields = ('id', 'name', 'color', 'slug')
 
 
 class IngredientSerializer(serializers.ModelSerializer):
     """Сериализатор для предоставления информации об ингредиентах"""
     class Meta:
         model = Ingredient
-        fields = '__all__'
+        fields = ('id', 'name', 'measurement_unit')
 
 
 class IngredientAmountSerializer(serializers.ModelSerializer):
@@ -79,9 +111,28 @@ class RecipeIngredientSerializer(serializers.ModelSerializer):
         fields = ('id', 'name', 'measurement_unit', 'amount')
 
 
+class RecipeImageField(serializers.ImageField):
+    """
+    URL версии изображения рецепта. Версия берётся из аргумента или из
+    контекста (image_rendition); пока она не готова, отдаётся оригинал.
+    """
+
+    def __init__(self, rendition=None, **kwargs):
+        self.rendition = rendition
+        kwargs['read_only'] = True
+        super().__init__(**kwargs)
+
+    def get_attribute(self, instance):
+        rendition = self.rendition or self.context.get(
+            'image_rendition', 'full'
+        )
+        return getattr(instance, f'image_{rendition}') or instance.image
+
+
 class RecipeReadSerializer(serializers.ModelSerializer):
     """Сериализатор для предоставления данных о рецепте для GET-запроса"""
     tags = TagSerializer(many=True)
+    image = RecipeImageField()
     author = UserSerializer(read_only=True)
     ingredients = serializers.SerializerMethodField()
     is_in_shopping_cart = SerializerMethodField(read_only=True)
@@ -99,8 +150,13 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             'cooking_time',
             'author',
             'is_in_shopping_cart',
-            'is_favorited'
+            'is_favorited',
+            'favorites_count',
+            'in_carts_count',
+            'pub_date',
+            'updated_at',
         ]
+        list_serializer_class = RelationsListSerializer
 
     def get_ingredients(self, instance):
         return RecipeIngredientSerializer(
@@ -108,24 +164,39 @@ class RecipeReadSerializer(serializers.ModelSerializer):
             many=True
         ).data
 
+    def add_relations(self, relations, recipes):
+        ids = [recipe.id for recipe in recipes]
+        relations.add('favorites', ids)
+        relations.add('shopping_cart', ids)
+        relations.add(
+            'subscriptions', [recipe.author_id for recipe in recipes]
+        )
+
+    def to_representation(self, instance):
+        if self.parent is None:
+            # Все флаги отдельного рецепта тоже одним запросом.
+            self.add_relations(
+                get_relations(self.context['request']), [instance]
+            )
+        return super().to_representation(instance)
+
     def get_is_in_shopping_cart(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user.shopping_cart.filter(recipe=obj).exists()
+        return get_relations(self.context['request']).has(
+            'shopping_cart', obj.id
+        )
 
     def get_is_favorited(self, obj):
-        user = self.context['request'].user
-        if user.is_anonymous:
-            return False
-        return user.favorites.filter(recipe=obj).exists()
+        return get_relations(self.context['request']).has(
+            'favorites', obj.id
+        )
 
 
 class RecipeCreateSerializer(serializers.ModelSerializer):
     """Сериализатор для добавления и изменения данных о рецепте"""
     author = UserSerializer(read_only=True)
     ingredients = IngredientAmountSerializer(many=True, allow_empty=False)
-    image = Base64ImageField()
+    image = Base64ImageField(required=False)
+    image_token = serializers.UUIDField(write_only=True, required=False)
 
     class Meta:
         model = Recipe
@@ -133,6 +204,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'id',
             'tags',
             'image',
+            'image_token',
             'ingredients',
             'name',
             'text',
@@ -140,6 +212,32 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
             'author'
         ]
 
+    def validate(self, attrs):
+        token = attrs.pop('image_token', None)
+        if token is not None:
+            upload = ImageUpload.objects.filter(
+                token=token, user=self.context['request'].user
+            ).first()
+            if upload is None:
+                raise serializers.ValidationError(
+                    {'image_token': 'Загруженное изображение не найдено'}
+                )
+            attrs['image'] = upload.image.name
+            attrs['image_upload'] = upload
+        elif self.instance is None and 'image' not in attrs:
+            raise serializers.ValidationError(
+                {'image': 'Обязательное поле.'}
+            )
+        return attrs
+
+    def validate_ingredients(self, ingredients):
+        ids = [ingredient['id'].id for ingredient in ingredients]
+        if len(ids) != len(set(ids)):
+            raise serializers.ValidationError(
+                'Ингредиенты не должны повторяться'
+            )
+        return ingredients
+
     def add_ingredients(self, ingredients, recipe):
         RecipeIngredient.objects.bulk_create(
             [RecipeIngredient(
@@ -150,27 +248,113 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
         )
 
     def add_tags(self, tags, recipe):
-        for tag in tags:
-            recipe.tags.add(tag)
+        Recipe.tags.through.objects.bulk_create(
+            [Recipe.tags.through(recipe=recipe, tag=tag)
+             for tag in set(tags)]
+        )
 
+    def update_tags(self, tags, recipe):
+        """
+        Удаляет и добавляет только изменившиеся теги.
+        """
+        through = Recipe.tags.through
+        current = set(through.objects.filter(
+            recipe=recipe
+        ).values_list('tag_id', flat=True))
+        new = {tag.id for tag in tags}
+        if current - new:
+            through.objects.filter(
+                recipe=recipe, tag_id__in=current - new
+            ).delete()
+        if new - current:
+            through.objects.bulk_create(
+                [through(recipe=recipe, tag_id=tag_id)
+                 for tag_id in new - current]
+            )
+
+    def update_ingredients(self, ingredients, recipe, current):
+        """
+        Приводит состав рецепта к новому: удаляет, добавляет и меняет
+        количество только у изменившихся ингредиентов.
+        current — {ingredient_id: (id строки, количество)}.
+        """
+        new = {
+            ingredient['id'].id: ingredient['amount']
+            for ingredient in ingredients
+        }
+        removed = current.keys() - new.keys()
+        if removed:
+            RecipeIngredient.objects.filter(
+                recipe=recipe, ingredient_id__in=removed
+            ).delete()
+        RecipeIngredient.objects.bulk_create(
+            [RecipeIngredient(
+                recipe=recipe,
+                ingredient_id=ingredient_id,
+                amount=amount,
+            ) for ingredient_id, amount in new.items()
+                if ingredient_id not in current]
+        )
+        changed = [
+            RecipeIngredient(pk=current[ingredient_id][0], amount=amount)
+            for ingredient_id, amount in new.items()
+            if ingredient_id in current
+            and current[ingredient_id][1] != amount
+        ]
+        if changed:
+            RecipeIngredient.objects.bulk_update(changed, ['amount'])
+        return new
+
+    def use_upload(self, validated_data):
+        upload = validated_data.pop('image_upload', None)
+        if upload is not None:
+            # Файл переходит к рецепту, запись о загрузке больше не нужна.
+            upload.delete()
+        elif 'image' in validated_data:
+            observe_upload('base64', validated_data['image'].size)
+
+    @transaction.atomic
     def create(self, validated_data):
         ingredients = validated_data.pop('ingredients')
         tags = validated_data.pop('tags')
+        self.use_upload(validated_data)
         recipe = Recipe.objects.create(**validated_data)
         self.add_ingredients(ingredients, recipe)
         self.add_tags(tags, recipe)
+        schedule_image_processing(recipe)
         return recipe
 
+    @transaction.atomic
     def update(self, instance, validated_data):
-        tags = validated_data.pop('tags')
-        ingredients = validated_data.pop('ingredients')
+        tags = validated_data.pop('tags', None)
+        ingredients = validated_data.pop('ingredients', None)
+        self.use_upload(validated_data)
+        if 'image' in validated_data:
+            schedule_file_deletion(recipe_files(instance))
+            for field in IMAGE_FIELDS[1:]:
+                validated_data[field] = ''
         instance = super().update(instance, validated_data)
-        instance.tags.clear()
-        instance.tags.set(tags)
-        instance.ingredients.clear()
-        self.add_ingredients(recipe=instance,
-                             ingredients=ingredients)
-        instance.save()
+        if 'image' in validated_data:
+            schedule_image_processing(instance)
+        if tags is not None:
+            self.update_tags(tags, instance)
+        if ingredients is not None:
+            current = {
+                ingredient_id: (pk, amount)
+                for pk, ingredient_id, amount in
+                instance.recipeingredient_set.values_list(
+                    'id', 'ingredient_id', 'amount'
+                )
+            }
+            new = self.update_ingredients(ingredients, instance, current)
+            change_recipe_in_shopping_lists(
+                instance,
+                {
+                    ingredient_id: amount
+                    for ingredient_id, (_, amount) in current.items()
+                },
+                new
+            )
         return instance
 
     def to_representation(self, recipe):
@@ -182,6 +366,7 @@ class RecipeCreateSerializer(serializers.ModelSerializer):
 
 class ShortRecipeSerializer(serializers.ModelSerializer):
     """Сериализатор для рецептов (сокращённая форма)"""
+    image = RecipeImageField('thumbnail')
 
     class Meta:
         model = Recipe
@@ -204,13 +389,17 @@ class UserWithRecipesSerializer(UserSerializer):
         ]
 
     def get_recipes(self, obj):
-        qs = obj.author_of.all()
-        recipes_limit = self.context['request'].query_params.get(
-            'recipes_limit'
-        )
-        if recipes_limit:
-            qs = qs[:int(recipes_limit)]
-        return ShortRecipeSerializer(qs, many=True) .data
+        if 'recipes' in self.context:
+            qs = self.context['recipes'][obj.id]
+        else:
+            qs = obj.author_of.all()
+            recipes_limit = get_recipes_limit(self.context['request'])
+            if recipes_limit is not None:
+                qs = qs[:recipes_limit]
+        return ShortRecipeSerializer(qs, many=True).data
 
     def get_recipes_count(self, obj):
-        return obj.author_of.count()
+        profile = getattr(obj, 'profile', None)
+        if profile is None:
+            return obj.author_of.count()
+        return profile.recipes_count
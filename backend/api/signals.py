@@ -0,0 +1,96 @@
+from django.contrib.auth import get_user_model
+from django.utils import timezone
+from django.db.models.signals import (
+    m2m_changed,
+    post_delete,
+    post_save,
+    pre_delete,
+)
+from django.dispatch import receiver
+
+from api import cache
+from api.etags import bump_versions
+from api.models import Ingredient, Profile, Recipe, RecipeIngredient, Tag
+from api.search import schedule_search_update
+
+User = get_user_model()
+
+
+@receiver([post_save, post_delete], sender=Ingredient)
+def invalidate_ingredients(sender, **kwargs):
+    cache.invalidate('ingredients', 'recipes')
+    bump_versions('ingredients', 'recipes')
+
+
+@receiver([post_save, post_delete], sender=Tag)
+def invalidate_tags(sender, **kwargs):
+    cache.invalidate('tags', 'recipes')
+    bump_versions('tags', 'recipes')
+
+
+@receiver([post_save, post_delete], sender=Recipe)
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+@receiver(m2m_changed, sender=Recipe.tags.through)
+def invalidate_recipes(sender, **kwargs):
+    cache.invalidate('recipes')
+    bump_versions('recipes')
+
+
+@receiver(post_save, sender=User)
+def invalidate_authors(sender, instance, created, update_fields=None,
+                       **kwargs):
+    if created or update_fields == frozenset(['last_login']):
+        return
+    cache.invalidate('recipes')
+    bump_versions('recipes')
+    Recipe.objects.filter(
+        author=instance
+    ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=User)
+def create_profile(sender, instance, created, raw=False, **kwargs):
+    """
+    Профиль со счётчиками есть у каждого пользователя, поэтому число
+    рецептов автора без рецептов не считается отдельным запросом.
+    """
+    if created and not raw:
+        Profile.objects.get_or_create(user=instance)
+
+
+@receiver([post_save, pre_delete], sender=Tag)
+def touch_tag_recipes(sender, instance, created=False, **kwargs):
+    """
+    Тег входит в представление рецепта, поэтому его изменение
+    обновляет updated_at (и ETag) связанных рецептов.
+    """
+    if not created:
+        Recipe.objects.filter(
+            tags=instance
+        ).update(updated_at=timezone.now())
+
+
+@receiver([post_save, pre_delete], sender=Ingredient)
+def touch_ingredient_recipes(sender, instance, created=False, **kwargs):
+    if not created:
+        Recipe.objects.filter(
+            ingredients=instance
+        ).update(updated_at=timezone.now())
+
+
+@receiver(post_save, sender=Recipe)
+def update_recipe_search(sender, instance, **kwargs):
+    schedule_search_update([instance.pk])
+
+
+@receiver([post_save, post_delete], sender=RecipeIngredient)
+def update_recipe_ingredients_search(sender, instance, **kwargs):
+    schedule_search_update([instance.recipe_id])
+
+
+@receiver(post_save, sender=Ingredient)
+def update_ingredient_recipes_search(sender, instance, created, **kwargs):
+    if not created:
+        schedule_search_update(Recipe.objects.filter(
+            ingredients=instance
+        ).values_list('pk', flat=True))
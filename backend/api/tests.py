@@ -0,0 +1,1281 @@
+import csv
+import itertools
+import json
+import os
+import shutil
+import sys
+import tempfile
+import time
+from base64 import b64decode
+from datetime import timedelta
+from io import StringIO
+from pathlib import Path
+from unittest import mock
+
+from asgiref.sync import async_to_sync
+from django.conf import settings
+from django.core.cache import cache
+from django.contrib.auth import get_user_model
+from django.core.files.base import ContentFile
+from django.core.files.storage import default_storage
+from django.core.files.uploadedfile import SimpleUploadedFile
+from django.core.handlers.asgi import ASGIHandler
+from django.core.management import call_command
+from django.db import connection
+from django.test import AsyncRequestFactory, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import include, path
+from django.utils import timezone
+from prometheus_client import REGISTRY
+from rest_framework.authtoken.models import Token
+from rest_framework.test import (
+    APIClient,
+    APITestCase,
+    APITransactionTestCase,
+)
+
+from api.autocomplete import ingredient_index
+from api.images import IMAGE_FIELDS, recipe_files
+from api.models import (
+    Tag,
+    Recipe,
+    Ingredient,
+    Favorite,
+    ImageUpload,
+    Profile,
+    RecipeIngredient,
+    ShoppingCartItem,
+    Subscription,
+)
+from api.urls import async_urlpatterns
+
+User = get_user_model()
+
+BUDGETS_PATH = Path(__file__).resolve().parent / 'query_budgets.json'
+INGREDIENTS_CSV = settings.BASE_DIR.parent / 'data' / 'ingredients.csv'
+
+RECIPES_COUNT = int(os.getenv('QUERY_BUDGET_RECIPES', 2000))
+AUTHORS_COUNT = 50
+INGREDIENTS_PER_RECIPE = 6
+
+IMAGE = (
+    'data:image/png;base64,iVBORw0KGgoAAAANSUhEUgAAAAEAAAABCAYAAAAfFcSJAAAA'
+    'DUlEQVR42mNk+M9QDwADhgGAWjR9awAAAABJRU5ErkJggg=='
+)
+RECIPE_FILTERS = ('author', 'tags', 'is_favorited', 'is_in_shopping_cart')
+MEDIA_ROOT = tempfile.mkdtemp()
+
+# Маршруты режима ASGI (ROOT_URLCONF для AsyncViewsTest): тесты
+# запускаются с SERVER_MODE=wsgi.
+urlpatterns = [
+    path('api/', include(list(async_urlpatterns))),
+    path('', include('foodgram.urls')),
+]
+
+
+def load_ingredients():
+    """Ингредиенты из data/ingredients.csv либо синтетический набор."""
+    if not INGREDIENTS_CSV.exists():
+        return [
+            Ingredient(name=f'ингредиент {i}', measurement_unit='г')
+            for i in range(2000)
+        ]
+    with open(INGREDIENTS_CSV, encoding='utf-8') as file:
+        return [
+            Ingredient(name=name, measurement_unit=measurement_unit)
+            for name, measurement_unit in csv.reader(file)
+        ]
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class QueryBudgetTest(APITestCase):
+    """
+    Проверка числа SQL-запросов и времени ответа для эндпоинтов API.
+
+    Бюджеты хранятся в query_budgets.json. Переменная окружения
+    QUERY_BUDGET_UPDATE=1 перезаписывает файл фактическими значениями,
+    QUERY_BUDGET_TIME=1 включает проверку времени ответа.
+    """
+    results = {}
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.budgets = json.loads(BUDGETS_PATH.read_text(encoding='utf-8'))
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass'
+        )
+        User.objects.bulk_create([
+            User(username=f'author{i}', email=f'author{i}@foodgram.ru')
+            for i in range(AUTHORS_COUNT)
+        ])
+        # bulk_create возвращает id не на всех СУБД, поэтому перечитываем.
+        authors = list(User.objects.exclude(pk=cls.user.pk).order_by('id'))
+        cls.author = authors[0]
+        Tag.objects.bulk_create([
+            Tag(name='Завтрак', slug='breakfast', color='#E26C2D'),
+            Tag(name='Обед', slug='lunch', color='#49B64E'),
+            Tag(name='Ужин', slug='dinner', color='#8775D2'),
+        ])
+        tags = list(Tag.objects.order_by('id'))
+        cls.tag = tags[0]
+        Ingredient.objects.bulk_create(load_ingredients(), batch_size=500)
+        ingredients = list(Ingredient.objects.values_list('id', flat=True))
+        cls.ingredient_id = ingredients[0]
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=authors[i % AUTHORS_COUNT],
+                name=f'Рецепт {i}',
+                text='Описание рецепта',
+                cooking_time=10 + i % 50,
+                image='recipes/recipe.png',
+            ) for i in range(RECIPES_COUNT)
+        ], batch_size=500)
+        recipes = list(Recipe.objects.order_by('id'))
+        Recipe.tags.through.objects.bulk_create([
+            Recipe.tags.through(recipe_id=recipe.id, tag_id=tag.id)
+            for i, recipe in enumerate(recipes)
+            for tag in tags[:1 + i % len(tags)]
+        ], batch_size=500)
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(
+                recipe_id=recipe.id,
+                ingredient_id=ingredients[
+                    (i * INGREDIENTS_PER_RECIPE + j) % len(ingredients)
+                ],
+                amount=10 * (j + 1),
+            )
+            for i, recipe in enumerate(recipes)
+            for j in range(INGREDIENTS_PER_RECIPE)
+        ], batch_size=500)
+        Subscription.objects.bulk_create([
+            Subscription(user=cls.user, author=author)
+            for author in authors[:AUTHORS_COUNT // 2]
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::7]
+        ])
+        ShoppingCartItem.objects.bulk_create([
+            ShoppingCartItem(user=cls.user, recipe=recipe)
+            for recipe in recipes[::11]
+        ])
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        call_command('recalculate_counters', stdout=StringIO())
+        cls.recipe = recipes[0]
+        cls.free_recipe = recipes[1]
+        cls.free_author = authors[-1]
+
+    @classmethod
+    def tearDownClass(cls):
+        cls.report()
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    @classmethod
+    def report(cls):
+        if not cls.results:
+            return
+        budgets = json.loads(BUDGETS_PATH.read_text(encoding='utf-8'))
+        lines = [
+            '',
+            f'{"эндпоинт":<62}{"запросы":>9}{"бюджет":>8}{"дельта":>8}'
+            f'{"мс":>9}',
+        ]
+        for name, (queries, elapsed) in sorted(cls.results.items()):
+            budget = budgets.get(name, {}).get('queries', 0)
+            lines.append(
+                f'{name:<62}{queries:>9}{budget:>8}'
+                f'{queries - budget:>+8}{elapsed:>9.1f}'
+            )
+        sys.stderr.write('\n'.join(lines) + '\n')
+        if os.getenv('QUERY_BUDGET_UPDATE'):
+            for name, (queries, elapsed) in cls.results.items():
+                budgets.setdefault(name, {'time_ms': 1000})
+                budgets[name]['queries'] = queries
+            BUDGETS_PATH.write_text(
+                json.dumps(budgets, indent=4, sort_keys=True) + '\n',
+                encoding='utf-8'
+            )
+
+    def setUp(self):
+        cache.clear()
+        self.anon = APIClient()
+        self.client.force_authenticate(self.user)
+
+    def assertWithinBudget(self, name, client, method, url, data=None,
+                           status_code=200, **headers):
+        with CaptureQueriesContext(connection) as context:
+            started = time.perf_counter()
+            response = getattr(client, method)(
+                url, data, format='json', **headers
+            )
+            if response.streaming:
+                response.body = b''.join(response.streaming_content)
+            elapsed = (time.perf_counter() - started) * 1000
+        self.assertEqual(response.status_code, status_code, name)
+        queries = len(context.captured_queries)
+        self.results[name] = (queries, elapsed)
+        if os.getenv('QUERY_BUDGET_UPDATE'):
+            return response
+        budget = self.budgets.get(name)
+        self.assertIsNotNone(budget, f'Нет бюджета для {name}')
+        self.assertLessEqual(
+            queries, budget['queries'],
+            f'{name}: {queries} запросов при бюджете {budget["queries"]}'
+        )
+        # Время зависит от машины, поэтому проверяется только по запросу.
+        if os.getenv('QUERY_BUDGET_TIME'):
+            self.assertLessEqual(
+                elapsed, budget['time_ms'],
+                f'{name}: {elapsed:.0f} мс при бюджете {budget["time_ms"]} мс'
+            )
+        return response
+
+    def test_tags(self):
+        self.assertWithinBudget('tags-list', self.anon, 'get', '/api/tags/')
+        self.assertWithinBudget(
+            'tags-detail', self.anon, 'get', f'/api/tags/{self.tag.id}/'
+        )
+
+    def test_ingredients(self):
+        self.assertWithinBudget(
+            'ingredients-list', self.anon, 'get', '/api/ingredients/'
+        )
+        self.assertWithinBudget(
+            'ingredients-search', self.anon, 'get', '/api/ingredients/',
+            {'name': 'аб'}
+        )
+        self.assertWithinBudget(
+            'ingredients-detail', self.anon, 'get',
+            f'/api/ingredients/{self.ingredient_id}/'
+        )
+
+    def test_recipes_list_filters(self):
+        params = {
+            'author': self.author.id,
+            'tags': ['breakfast', 'lunch'],
+            'is_favorited': 1,
+            'is_in_shopping_cart': 1,
+        }
+        for size in range(len(RECIPE_FILTERS) + 1):
+            for combination in itertools.combinations(RECIPE_FILTERS, size):
+                name = 'recipes-list'
+                if combination:
+                    name += f'[{"+".join(combination)}]'
+                query = {key: params[key] for key in combination}
+                query['limit'] = 6
+                self.assertWithinBudget(
+                    name, self.client, 'get', '/api/recipes/', query
+                )
+        self.assertWithinBudget(
+            'recipes-list-anonymous', self.anon, 'get', '/api/recipes/',
+            {'limit': 6}
+        )
+        self.assertWithinBudget(
+            'recipes-list-page-size-100', self.client, 'get',
+            '/api/recipes/', {'limit': 100}
+        )
+
+    def test_recipes_pagination(self):
+        page = self.assertWithinBudget(
+            'recipes-list-cursor', self.client, 'get', '/api/recipes/',
+            {'pagination': 'cursor', 'tags': 'lunch', 'limit': 6}
+        ).json()
+        self.assertNotIn('count', page)
+        ids = [recipe['id'] for recipe in page['results']]
+        response = self.assertWithinBudget(
+            'recipes-list-cursor-next', self.client, 'get', page['next']
+        )
+        ids += [recipe['id'] for recipe in response.json()['results']]
+        expected = list(Recipe.objects.filter(
+            tags__slug='lunch'
+        ).values_list('id', flat=True)[:12])
+        self.assertEqual(ids, expected)
+        page = self.assertWithinBudget(
+            'recipes-list-no-count', self.client, 'get', '/api/recipes/',
+            {'count': 'false', 'page': 2, 'limit': 6}
+        ).json()
+        self.assertIsNone(page['count'])
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']],
+            list(Recipe.objects.values_list('id', flat=True)[6:12])
+        )
+        self.assertIn('page=3', page['next'])
+        self.assertNotIn('page=', page['previous'])
+        subscriptions = self.client.get('/api/users/subscriptions/', {
+            'pagination': 'cursor', 'limit': 20
+        }).json()
+        rest = self.client.get(subscriptions['next']).json()
+        self.assertIsNone(rest['next'])
+        self.assertEqual(
+            len({author['id'] for author in subscriptions['results']}
+                | {author['id'] for author in rest['results']}),
+            AUTHORS_COUNT // 2
+        )
+
+    def test_recipes_changed_since(self):
+        recipes = list(Recipe.objects.all()[:3])
+        since = timezone.now()
+        Recipe.objects.filter(
+            pk__in=[recipe.pk for recipe in recipes[1:]]
+        ).update(updated_at=since + timedelta(seconds=1))
+        page = self.assertWithinBudget(
+            'recipes-list-since', self.client, 'get', '/api/recipes/',
+            {'since': since.isoformat(), 'limit': 6}
+        ).json()
+        self.assertEqual(
+            [recipe['id'] for recipe in page['results']],
+            [recipe.pk for recipe in recipes[1:]]
+        )
+        self.assertIn('updated_at', page['results'][0])
+        page = self.client.get('/api/recipes/', {
+            'until': since.isoformat(), 'limit': 1
+        }).json()
+        self.assertEqual(page['count'], RECIPES_COUNT - 2)
+
+    @override_settings(PAGINATION_ESTIMATE_THRESHOLD=100)
+    def test_recipes_estimated_count(self):
+        query = {'tags': 'lunch', 'limit': 6}
+        page = self.client.get('/api/recipes/', query).json()
+        self.assertNotIn('count_estimated', page)
+        self.assertEqual(
+            page['count'], Recipe.objects.filter(tags__slug='lunch').count()
+        )
+        response = self.assertWithinBudget(
+            'recipes-list-estimated-count', self.client, 'get',
+            '/api/recipes/', {**query, 'page': 2}
+        )
+        self.assertTrue(response.json()['count_estimated'])
+        self.assertEqual(response.json()['count'], page['count'])
+        small = self.client.get('/api/recipes/', {
+            'author': self.author.id, 'limit': 6
+        }).json()
+        self.assertNotIn('count_estimated', small)
+
+    def test_recipes_search(self):
+        Recipe.objects.filter(pk=self.free_recipe.pk).update(
+            name='Борщ с пампушками'
+        )
+        response = self.assertWithinBudget(
+            'recipes-list-search', self.client, 'get', '/api/recipes/',
+            {'search': 'Борщ пампушками', 'limit': 6}
+        )
+        self.assertEqual(
+            [recipe['id'] for recipe in response.json()['results']],
+            [self.free_recipe.id]
+        )
+        ingredient = Ingredient.objects.get(pk=self.ingredient_id)
+        response = self.client.get('/api/recipes/', {
+            'search': ingredient.name, 'limit': 100
+        })
+        found = [recipe['id'] for recipe in response.json()['results']]
+        self.assertTrue(found)
+        self.assertEqual(
+            Recipe.objects.filter(
+                pk__in=found, ingredients=ingredient
+            ).count(),
+            len(found)
+        )
+
+    def test_recipes_by_ingredients(self):
+        own = list(self.free_recipe.recipeingredient_set.values_list(
+            'ingredient_id', flat=True
+        ))
+        other = Ingredient.objects.exclude(pk__in=own).first().id
+        include = [*own[:2], other]
+
+        def found(**params):
+            response = self.client.get(
+                '/api/recipes/', {'limit': 100, **params}
+            )
+            return [recipe['id'] for recipe in response.json()['results']]
+
+        response = self.assertWithinBudget(
+            'recipes-list-ingredients', self.client, 'get', '/api/recipes/',
+            {'ingredients': ','.join(map(str, include)),
+             'min_coverage': 0.6, 'limit': 100}
+        )
+        ids = [recipe['id'] for recipe in response.json()['results']]
+        self.assertIn(self.free_recipe.id, ids)
+        coverage = [
+            len(set(include) & set(RecipeIngredient.objects.filter(
+                recipe_id=pk
+            ).values_list('ingredient_id', flat=True)))
+            for pk in ids
+        ]
+        self.assertEqual(coverage, sorted(coverage, reverse=True))
+        self.assertTrue(all(matched >= 2 for matched in coverage))
+        ids = found(ingredients=','.join(map(str, own[:2])))
+        self.assertIn(self.free_recipe.id, ids)
+        for pk in ids:
+            self.assertEqual(RecipeIngredient.objects.filter(
+                recipe_id=pk, ingredient_id__in=own[:2]
+            ).count(), 2)
+        ids = found(ingredients=own[0], exclude_ingredients=own[1])
+        self.assertNotIn(self.free_recipe.id, ids)
+        response = self.client.get('/api/recipes/', {
+            'ingredients': own[0], 'min_coverage': 2
+        })
+        self.assertEqual(response.status_code, 400)
+
+    def test_anonymous_cache(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertEqual(self.anon.get(url)['X-Cache'], 'MISS')
+        response = self.assertWithinBudget(
+            'recipes-detail-anonymous-cached', self.anon, 'get', url
+        )
+        self.assertEqual(response['X-Cache'], 'HIT')
+        self.assertEqual(self.client.get(url).get('X-Cache'), None)
+        self.tag.name = 'Второй завтрак'
+        self.tag.save()
+        response = self.anon.get(url)
+        self.assertEqual(response['X-Cache'], 'MISS')
+        self.assertEqual(response.json()['tags'][0]['name'], 'Второй завтрак')
+        self.anon.get('/api/tags/', {'b': 1, 'a': 2})
+        self.assertEqual(
+            self.anon.get('/api/tags/', {'a': 2, 'b': 1})['X-Cache'], 'HIT'
+        )
+
+    def test_conditional_get(self):
+        urls = {
+            'tags-list': '/api/tags/',
+            'ingredients-list': '/api/ingredients/',
+            'recipes-list': '/api/recipes/',
+            'recipes-detail': f'/api/recipes/{self.recipe.id}/',
+        }
+        for name, url in urls.items():
+            for client, suffix in ((self.anon, '-anonymous'), (self.client, '')):
+                etag = client.get(url)['ETag']
+                self.assertWithinBudget(
+                    f'{name}{suffix}-not-modified', client, 'get', url,
+                    status_code=304, HTTP_IF_NONE_MATCH=etag
+                )
+        url = f'/api/recipes/{self.free_recipe.id}/'
+        etag = self.client.get(url)['ETag']
+        self.client.post(url + 'favorite/')
+        self.assertEqual(self.client.get(
+            url, HTTP_IF_NONE_MATCH=etag
+        ).status_code, 200)
+        last_modified = self.anon.get(urls['recipes-detail'])['Last-Modified']
+        self.assertEqual(self.anon.get(
+            urls['recipes-detail'], HTTP_IF_MODIFIED_SINCE=last_modified
+        ).status_code, 304)
+        # Удаление не меняет максимум updated_at, поэтому у списков только
+        # ETag, а он берётся из счётчика изменений.
+        response = self.anon.get(urls['tags-list'])
+        self.assertNotIn('Last-Modified', response)
+        # Закэшированный список читает только счётчик, без COUNT(*)
+        # по таблице рецептов.
+        self.anon.get(urls['recipes-list'])
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(
+                self.anon.get(urls['recipes-list'])['X-Cache'], 'HIT'
+            )
+        self.assertEqual(len(context.captured_queries), 1)
+        self.assertIn('api_dataversion', context.captured_queries[0]['sql'])
+        Tag.objects.create(name='Полдник', slug='snack', color='#000000')
+        etag = self.anon.get(urls['tags-list'])['ETag']
+        Tag.objects.filter(slug='snack').delete()
+        self.assertEqual(self.anon.get(
+            urls['tags-list'], HTTP_IF_NONE_MATCH=etag
+        ).status_code, 200)
+
+    def test_recipes_detail(self):
+        url = f'/api/recipes/{self.recipe.id}/'
+        self.assertWithinBudget('recipes-detail', self.client, 'get', url)
+        self.assertWithinBudget(
+            'recipes-detail-anonymous', self.anon, 'get', url
+        )
+
+    def test_recipes_write(self):
+        data = {
+            'tags': [self.tag.id],
+            'ingredients': [
+                {'id': self.ingredient_id, 'amount': 100},
+            ],
+            'image': IMAGE,
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 15,
+        }
+        self.client.force_authenticate(self.author)
+        response = self.assertWithinBudget(
+            'recipes-create', self.client, 'post', '/api/recipes/', data,
+            status_code=201
+        )
+        url = f'/api/recipes/{response.json()["id"]}/'
+        data['name'] = 'Изменённый рецепт'
+        self.assertWithinBudget(
+            'recipes-update', self.client, 'patch', url, data
+        )
+
+    def test_favorite_and_shopping_cart(self):
+        for name in ('favorite', 'shopping_cart'):
+            url = f'/api/recipes/{self.free_recipe.id}/{name}/'
+            self.assertWithinBudget(
+                f'recipes-{name}-add', self.client, 'post', url,
+                status_code=201
+            )
+            self.assertWithinBudget(
+                f'recipes-{name}-delete', self.client, 'delete', url,
+                status_code=204
+            )
+
+    def test_download_shopping_cart(self):
+        self.assertWithinBudget(
+            'recipes-download-shopping-cart', self.client, 'get',
+            '/api/recipes/download_shopping_cart/'
+        )
+        for file_format in ('csv', 'pdf'):
+            self.assertWithinBudget(
+                f'recipes-download-shopping-cart-{file_format}', self.client,
+                'get', '/api/recipes/download_shopping_cart/',
+                {'file_format': file_format}
+            )
+
+    def test_subscriptions(self):
+        self.assertWithinBudget(
+            'subscriptions-list', self.client, 'get',
+            '/api/users/subscriptions/', {'limit': 6}
+        )
+        self.assertWithinBudget(
+            'subscriptions-list-recipes-limit', self.client, 'get',
+            '/api/users/subscriptions/', {'limit': 6, 'recipes_limit': 3}
+        )
+        response = self.client.get(
+            '/api/users/subscriptions/', {'limit': 100, 'recipes_limit': 2}
+        ).json()
+        self.assertEqual(response['count'], AUTHORS_COUNT // 2)
+        for author in response['results']:
+            self.assertTrue(author['is_subscribed'])
+            self.assertEqual(len(author['recipes']), 2)
+            self.assertEqual(
+                author['recipes_count'],
+                Recipe.objects.filter(author_id=author['id']).count()
+            )
+        self.assertEqual(self.client.get(
+            '/api/users/subscriptions/', {'recipes_limit': 'abc'}
+        ).status_code, 400)
+        url = f'/api/users/{self.free_author.id}/subscribe/'
+        self.assertEqual(
+            self.client.post(f'{url}?recipes_limit=abc').status_code, 400
+        )
+        self.assertFalse(Subscription.objects.filter(
+            user=self.user, author=self.free_author
+        ).exists())
+        response = self.assertWithinBudget(
+            'subscribe-add', self.client, 'post', f'{url}?recipes_limit=1',
+            status_code=201
+        )
+        self.assertLessEqual(len(response.json()['recipes']), 1)
+        self.assertWithinBudget(
+            'subscribe-delete', self.client, 'delete', url, status_code=204
+        )
+
+    def test_users(self):
+        self.assertWithinBudget(
+            'users-list', self.client, 'get', '/api/users/', {'limit': 6}
+        )
+        self.assertWithinBudget(
+            'users-me', self.client, 'get', '/api/users/me/'
+        )
+        self.assertWithinBudget(
+            'users-detail', self.client, 'get', f'/api/users/{self.author.id}/'
+        )
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class FunctionalTestCase(APITestCase):
+    """
+    Функциональные проверки на небольшом наборе данных. Бюджеты
+    запросов проверяет QueryBudgetTest на полном наборе.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass'
+        )
+        authors = [
+            User.objects.create_user(
+                username=f'author{i}', email=f'author{i}@foodgram.ru'
+            )
+            for i in range(3)
+        ]
+        cls.author = authors[0]
+        cls.free_author = authors[-1]
+        tags = [
+            Tag.objects.create(name='Завтрак', slug='breakfast',
+                               color='#E26C2D'),
+            Tag.objects.create(name='Обед', slug='lunch', color='#49B64E'),
+            Tag.objects.create(name='Ужин', slug='dinner', color='#8775D2'),
+        ]
+        cls.tag = tags[0]
+        ingredients = [
+            Ingredient.objects.create(
+                name=f'ингредиент {i}', measurement_unit='г'
+            )
+            for i in range(10)
+        ]
+        cls.ingredient_id = ingredients[0].id
+        recipes = []
+        for i in range(12):
+            recipe = Recipe.objects.create(
+                author=authors[i % len(authors)],
+                name=f'Рецепт {i}',
+                text='Описание рецепта',
+                cooking_time=10 + i,
+                image='recipes/recipe.png',
+            )
+            recipe.tags.set(tags[:1 + i % len(tags)])
+            RecipeIngredient.objects.bulk_create([
+                RecipeIngredient(
+                    recipe=recipe,
+                    ingredient=ingredients[(i * 3 + j) % len(ingredients)],
+                    amount=10 * (j + 1),
+                )
+                for j in range(3)
+            ])
+            recipes.append(recipe)
+        Subscription.objects.bulk_create([
+            Subscription(user=cls.user, author=author)
+            for author in authors[:2]
+        ])
+        Favorite.objects.bulk_create([
+            Favorite(user=cls.user, recipe=recipe) for recipe in recipes[::4]
+        ])
+        ShoppingCartItem.objects.bulk_create([
+            ShoppingCartItem(user=cls.user, recipe=recipe)
+            for recipe in recipes[::5]
+        ])
+        call_command('rebuild_shopping_lists', stdout=StringIO())
+        call_command('recalculate_counters', stdout=StringIO())
+        cls.recipe = recipes[0]
+        cls.free_recipe = recipes[1]
+
+    @classmethod
+    def tearDownClass(cls):
+        shutil.rmtree(MEDIA_ROOT, ignore_errors=True)
+        super().tearDownClass()
+
+    def setUp(self):
+        cache.clear()
+        self.anon = APIClient()
+        self.client.force_authenticate(self.user)
+
+
+class IngredientTest(FunctionalTestCase):
+    """
+    Автодополнение ингредиентов.
+    """
+
+    def test_ingredient_autocomplete(self):
+        for name in ('Зюзяка белая', 'мегазюзяка', 'белая зюзяка', 'зюзяка',
+                     'Ёрзуля'):
+            Ingredient.objects.create(name=name, measurement_unit='г')
+
+        def names(query, **kwargs):
+            return [
+                item['name']
+                for item in ingredient_index.search(query, **kwargs)
+            ]
+
+        self.assertEqual(
+            names('ЗЮЗЯ'),
+            ['зюзяка', 'Зюзяка белая', 'белая зюзяка', 'мегазюзяка']
+        )
+        self.assertEqual(names('зюзя', limit=2), ['зюзяка', 'Зюзяка белая'])
+        self.assertEqual(names('ерзу'), ['Ёрзуля'])
+        self.assertEqual(names('ЁРЗУ'), ['Ёрзуля'])
+        with override_settings(INGREDIENT_SEARCH_LIMIT=3):
+            response = self.anon.get('/api/ingredients/', {'name': 'зюзя'})
+        self.assertEqual(len(response.json()), 3)
+        # Изменения видны без кэша: версия — счётчик в базе.
+        ingredient = Ingredient.objects.get(name='мегазюзяка')
+        ingredient.name = 'зюзякамега'
+        ingredient.save()
+        self.assertEqual(names('зюзяка')[:2], ['зюзяка', 'Зюзяка белая'])
+        self.assertIn('зюзякамега', names('зюзяка'))
+        Ingredient.objects.filter(name='зюзяка').delete()
+        self.assertNotIn('зюзяка', names('зюзя'))
+
+
+class RecipeTest(FunctionalTestCase):
+    """
+    Рецепты, избранное, список покупок и счётчики.
+    """
+
+    def test_invalid_id(self):
+        for url in ('/api/recipes/abc/', '/api/tags/abc/',
+                    '/api/ingredients/abc/'):
+            self.assertEqual(self.anon.get(url).status_code, 404, url)
+            self.assertEqual(self.client.get(url).status_code, 404, url)
+
+    def test_relation_flags(self):
+        favorites = set(self.user.favorites.values_list('recipe', flat=True))
+        cart = set(self.user.shopping_cart.values_list('recipe', flat=True))
+        subscriptions = set(
+            self.user.subscriptions.values_list('author', flat=True)
+        )
+        results = self.client.get('/api/recipes/', {'limit': 50}).json()[
+            'results'
+        ]
+        results.append(self.client.get(
+            f'/api/recipes/{self.recipe.id}/'
+        ).json())
+        for recipe in results:
+            self.assertEqual(recipe['is_favorited'], recipe['id'] in favorites)
+            self.assertEqual(
+                recipe['is_in_shopping_cart'], recipe['id'] in cart
+            )
+            self.assertEqual(
+                recipe['author']['is_subscribed'],
+                recipe['author']['id'] in subscriptions
+            )
+        for user in self.client.get('/api/users/').json()['results']:
+            self.assertEqual(user['is_subscribed'], user['id'] in subscriptions)
+
+    def test_counters_match_relations(self):
+        recipe_url = f'/api/recipes/{self.free_recipe.id}/'
+        self.client.post(recipe_url + 'favorite/')
+        self.client.post(recipe_url + 'shopping_cart/')
+        self.client.delete(recipe_url + 'shopping_cart/')
+        self.client.force_authenticate(self.free_author)
+        self.client.post('/api/recipes/', {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient_id, 'amount': 1}],
+            'image': IMAGE,
+            'name': 'Новый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }, format='json')
+        counters = (
+            list(Recipe.objects.values_list(
+                'id', 'favorites_count', 'in_carts_count'
+            ).order_by('id')),
+            list(User.objects.values_list(
+                'id', 'profile__recipes_count'
+            ).order_by('id')),
+        )
+        call_command('recalculate_counters', stdout=StringIO())
+        self.assertEqual(counters, (
+            list(Recipe.objects.values_list(
+                'id', 'favorites_count', 'in_carts_count'
+            ).order_by('id')),
+            list(User.objects.values_list(
+                'id', 'profile__recipes_count'
+            ).order_by('id')),
+        ))
+
+    def test_shopping_list_matches_cart(self):
+        url = f'/api/recipes/{self.free_recipe.id}/shopping_cart/'
+        self.assertEqual(self.client.post(url).status_code, 201)
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+        self.client.force_authenticate(self.free_recipe.author)
+        response = self.client.patch(f'/api/recipes/{self.free_recipe.id}/', {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient_id, 'amount': 7}],
+            'image': IMAGE,
+            'name': 'Изменённый рецепт',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 200)
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+        self.client.force_authenticate(self.user)
+        self.assertEqual(self.client.delete(url).status_code, 204)
+        call_command('rebuild_shopping_lists', '--check', stdout=StringIO())
+
+    def test_recipes_update_diff(self):
+        recipe = self.free_recipe
+        url = f'/api/recipes/{recipe.id}/'
+        self.client.force_authenticate(recipe.author)
+        tags = set(recipe.tags.values_list('id', flat=True))
+        ingredients = dict(recipe.recipeingredient_set.values_list(
+            'ingredient_id', 'amount'
+        ))
+        response = self.client.patch(url, {'name': 'Только название'},
+                                     format='json')
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            set(recipe.tags.values_list('id', flat=True)), tags
+        )
+        other_tag = Tag.objects.exclude(pk__in=tags).first()
+        kept, *removed = ingredients
+        added = Ingredient.objects.exclude(pk__in=ingredients).first().id
+        self.client.patch(url, {
+            'tags': [other_tag.id],
+            'ingredients': [
+                {'id': kept, 'amount': ingredients[kept] + 1},
+                {'id': added, 'amount': 3},
+            ],
+        }, format='json')
+        self.assertEqual(
+            set(recipe.tags.values_list('id', flat=True)), {other_tag.id}
+        )
+        self.assertEqual(
+            dict(recipe.recipeingredient_set.values_list(
+                'ingredient_id', 'amount'
+            )),
+            {kept: ingredients[kept] + 1, added: 3}
+        )
+        response = self.client.patch(url, {
+            'ingredients': [
+                {'id': added, 'amount': 1}, {'id': added, 'amount': 2},
+            ],
+        }, format='json')
+        self.assertEqual(response.status_code, 400)
+
+    def test_download_shopping_cart_without_server_cursors(self):
+        url = '/api/recipes/download_shopping_cart/'
+        expected = b''.join(self.client.get(url).streaming_content)
+        with mock.patch.dict(
+            connection.settings_dict, {'DISABLE_SERVER_SIDE_CURSORS': True}
+        ), mock.patch('api.utils.EXPORT_CHUNK_SIZE', 3):
+            content = b''.join(self.client.get(url).streaming_content)
+        self.assertEqual(content, expected)
+
+
+class MediaTest(FunctionalTestCase):
+    """
+    Изображения рецептов, файлы в хранилище и выгрузка данных.
+    """
+
+    @override_settings(IMAGE_PROCESSING_WORKERS=0)
+    def test_image_renditions(self):
+        self.client.force_authenticate(self.author)
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', {
+                'tags': [self.tag.id],
+                'ingredients': [{'id': self.ingredient_id, 'amount': 1}],
+                'image': IMAGE,
+                'name': 'Рецепт с фото',
+                'text': 'Описание',
+                'cooking_time': 5,
+            }, format='json')
+        recipe = Recipe.objects.get(pk=response.json()['id'])
+        for rendition in ('thumbnail', 'medium', 'full'):
+            self.assertTrue(getattr(recipe, f'image_{rendition}'))
+        url = f'/api/recipes/{recipe.id}/'
+        self.assertTrue(
+            self.client.get(url).json()['image'].endswith(
+                recipe.image_full.url
+            )
+        )
+        response = self.client.post(url + 'favorite/')
+        self.assertEqual(response.json()['image'], recipe.image_thumbnail.url)
+
+    @override_settings(IMAGE_PROCESSING_WORKERS=0)
+    def test_image_files_deleted_on_commit(self):
+        self.client.force_authenticate(self.author)
+        data = {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient_id, 'amount': 1}],
+            'image': IMAGE,
+            'name': 'Рецепт с фото',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }
+        with self.captureOnCommitCallbacks(execute=True):
+            response = self.client.post('/api/recipes/', data, format='json')
+        url = f'/api/recipes/{response.json()["id"]}/'
+        old_files = recipe_files(Recipe.objects.get(pk=response.json()['id']))
+        self.assertEqual(len(old_files), len(IMAGE_FIELDS))
+        # Файлы удаляются только после коммита: при откате они нужны.
+        with self.captureOnCommitCallbacks() as callbacks:
+            response = self.client.patch(url, data, format='json')
+        self.assertEqual(response.status_code, 200)
+        for name in old_files:
+            self.assertTrue(default_storage.exists(name), name)
+        for callback in callbacks:
+            callback()
+        for name in old_files:
+            self.assertFalse(default_storage.exists(name), name)
+        new_files = recipe_files(Recipe.objects.get(pk=response.json()['id']))
+        self.assertEqual(len(new_files), len(IMAGE_FIELDS))
+        with self.captureOnCommitCallbacks(execute=True):
+            self.assertEqual(self.client.delete(url).status_code, 204)
+        for name in new_files:
+            self.assertFalse(default_storage.exists(name), name)
+
+    def test_collect_orphaned_media(self):
+        names = {
+            key: default_storage.save(
+                f'recipes/{key}.png', ContentFile(b64decode(IMAGE[22:]))
+            )
+            for key in ('orphan', 'fresh', 'used', 'upload', 'expired')
+        }
+        old = time.time() - 48 * 3600
+        for key in ('orphan', 'used', 'upload', 'expired'):
+            os.utime(default_storage.path(names[key]), (old, old))
+        Recipe.objects.filter(pk=self.free_recipe.pk).update(
+            image=names['used']
+        )
+        ImageUpload.objects.create(user=self.user, image=names['upload'])
+        expired = ImageUpload.objects.create(
+            user=self.user, image=names['expired']
+        )
+        ImageUpload.objects.filter(pk=expired.pk).update(
+            created=timezone.now() - timedelta(hours=48)
+        )
+        output = StringIO()
+        call_command('collect_orphaned_media', '--dry-run', stdout=output)
+        self.assertIn('Будет удалено', output.getvalue())
+        for name in names.values():
+            self.assertTrue(default_storage.exists(name), name)
+        self.assertTrue(ImageUpload.objects.filter(pk=expired.pk).exists())
+        call_command('collect_orphaned_media', '--batch-size', 2,
+                     stdout=StringIO())
+        self.assertFalse(ImageUpload.objects.filter(pk=expired.pk).exists())
+        for key, exists in (('orphan', False), ('fresh', True),
+                            ('used', True), ('upload', True),
+                            ('expired', False)):
+            self.assertEqual(
+                default_storage.exists(names[key]), exists, key
+            )
+
+    def test_image_upload(self):
+        png = b64decode(IMAGE.split(',')[1])
+        response = self.client.post('/api/recipes/images/', {
+            'image': SimpleUploadedFile('photo.png', png),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 201)
+        token = response.json()['token']
+        response = self.client.post('/api/recipes/', {
+            'tags': [self.tag.id],
+            'ingredients': [{'id': self.ingredient_id, 'amount': 1}],
+            'image_token': token,
+            'name': 'Рецепт с загруженным фото',
+            'text': 'Описание',
+            'cooking_time': 5,
+        }, format='json')
+        self.assertEqual(response.status_code, 201)
+        self.assertTrue(response.json()['image'].endswith('.png'))
+        self.assertFalse(ImageUpload.objects.filter(token=token).exists())
+        response = self.client.post('/api/recipes/images/', {
+            'image': SimpleUploadedFile('photo.png', b'not an image'),
+        }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=len(png) - 1):
+            response = self.client.post('/api/recipes/images/', {
+                'image': SimpleUploadedFile('photo.png', png),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        # Тело больше лимита с запасом отклоняется до разбора multipart.
+        with override_settings(IMAGE_UPLOAD_MAX_SIZE=len(png)):
+            response = self.client.post('/api/recipes/images/', {
+                'image': SimpleUploadedFile(
+                    'photo.png', png + b'\0' * 128 * 1024
+                ),
+            }, format='multipart')
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(response.json(), {'image': 'Файл слишком большой'})
+
+    def test_export_import_recipes(self):
+        exported = StringIO()
+        call_command('export_data', 'recipes', stdout=exported,
+                     stderr=StringIO())
+        path = Path(MEDIA_ROOT) / 'recipes.json'
+        path.write_text(exported.getvalue(), encoding='utf-8')
+        count = Recipe.objects.count()
+        recipes = list(self.free_author.author_of.values_list(
+            'name', 'ingredients__name', 'recipeingredient__amount'
+        ).order_by('name', 'ingredients__name'))
+        self.free_author.author_of.all().delete()
+        for _ in range(2):
+            call_command('import_data', 'recipes', str(path),
+                         stdout=StringIO(), stderr=StringIO())
+            self.assertEqual(
+                list(self.free_author.author_of.values_list(
+                    'name', 'ingredients__name', 'recipeingredient__amount'
+                ).order_by('name', 'ingredients__name')),
+                recipes
+            )
+        self.assertEqual(Recipe.objects.count(), count)
+
+
+class MonitoringTest(FunctionalTestCase):
+    """
+    Профилирование, метрики и проверка планов запросов.
+    """
+
+    def test_check_query_plans(self):
+        output = StringIO()
+        call_command('check_query_plans', '--user', self.user.id,
+                     '--min-rows', 10 ** 9, stdout=output)
+        self.assertIn('/api/recipes/?is_favorited=1: 200', output.getvalue())
+
+    @override_settings(PROFILING_ENABLED=True)
+    def test_profiling(self):
+        call_command('profiling_report', '--reset', stdout=StringIO())
+        client = APIClient()
+        client.force_authenticate(self.user)
+        response = client.get('/api/recipes/', {'is_favorited': 1})
+        self.assertIn('sql;dur=', response['Server-Timing'])
+        output = StringIO()
+        call_command('profiling_report', stdout=output)
+        self.assertIn('GET recipe-list', output.getvalue())
+
+    @override_settings(METRICS_ENABLED=True)
+    def test_metrics(self):
+        client = APIClient()
+        client.get('/api/tags/')
+        client.get('/api/recipes/')
+        client.get('/api/recipes/')
+        metrics = client.get('/metrics').content.decode()
+        for line in (
+            'foodgram_http_requests_total{method="GET",status="200",'
+            'view="TagViewSet.list"}',
+            'foodgram_db_queries_per_request_count{view="RecipeViewSet.list"}',
+            'foodgram_response_cache_requests_total'
+            '{namespace="recipes",result="hit"}',
+        ):
+            self.assertIn(line, metrics)
+        with override_settings(METRICS_ENABLED=False):
+            self.assertEqual(client.get('/metrics').status_code, 404)
+
+
+class ShoppingCartExportTest(APITestCase):
+    """
+    Выгрузка списка покупок.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass'
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def test_pdf_font_missing(self):
+        url = '/api/recipes/download_shopping_cart/'
+        with mock.patch('api.utils.PDF_FONT', 'MissingFont'):
+            with override_settings(PDF_FONT_PATH='/nonexistent/font.ttf'):
+                with self.assertLogs('api.utils', 'ERROR'):
+                    response = self.client.get(url, {'file_format': 'pdf'})
+        self.assertEqual(response.status_code, 503)
+        self.assertFalse(response.streaming)
+        self.assertIn('detail', response.json())
+        response = self.client.get(url, {'file_format': 'pdf'})
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(b''.join(response.streaming_content).startswith(
+            b'%PDF'
+        ))
+
+
+class SubscriptionTest(APITestCase):
+    """
+    Подписки на новых авторов без рецептов.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass'
+        )
+
+    def setUp(self):
+        self.client.force_authenticate(self.user)
+
+    def subscribe(self, count):
+        for i in range(count):
+            author = User.objects.create_user(
+                username=f'new{count}{i}', email=f'new{count}{i}@foodgram.ru'
+            )
+            self.assertTrue(Profile.objects.filter(
+                user=author, recipes_count=0
+            ).exists())
+            self.assertEqual(self.client.post(
+                f'/api/users/{author.id}/subscribe/'
+            ).status_code, 201)
+
+    def test_authors_without_recipes(self):
+        self.subscribe(1)
+        with CaptureQueriesContext(connection) as single:
+            self.client.get('/api/users/subscriptions/')
+        self.subscribe(3)
+        with CaptureQueriesContext(connection) as several:
+            response = self.client.get('/api/users/subscriptions/')
+        self.assertEqual(len(several), len(single))
+        self.assertEqual(
+            [author['recipes_count'] for author in response.json()['results']],
+            [0] * 4
+        )
+
+
+class PaginationTest(APITestCase):
+    """
+    Постраничная пагинация с приблизительным count.
+    """
+
+    @classmethod
+    def setUpTestData(cls):
+        cls.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass'
+        )
+        Recipe.objects.bulk_create([
+            Recipe(
+                author=cls.user, name=f'Рецепт {i}', text='Описание',
+                cooking_time=10, image='recipes/recipe.png',
+            ) for i in range(20)
+        ])
+        ingredient = Ingredient.objects.create(
+            name='абрикос', measurement_unit='г'
+        )
+        cls.ingredient_id = ingredient.id
+        RecipeIngredient.objects.bulk_create([
+            RecipeIngredient(recipe=recipe, ingredient=ingredient, amount=1)
+            for recipe in Recipe.objects.all()[:10]
+        ])
+
+    def setUp(self):
+        cache.clear()
+        self.client.force_authenticate(self.user)
+
+    @override_settings(PAGINATION_ESTIMATE_THRESHOLD=5)
+    def test_underestimated_count(self):
+        ids = []
+        url = '/api/recipes/?limit=6'
+        # Оценка планировщика меньше реального числа строк.
+        with mock.patch('api.pagination.planner_estimate', return_value=10):
+            while url:
+                page = self.client.get(url).json()
+                self.assertEqual(page['count'], 10)
+                self.assertTrue(page['count_estimated'])
+                ids += [recipe['id'] for recipe in page['results']]
+                url = page['next']
+            self.assertEqual(ids, list(Recipe.objects.order_by(
+                '-pub_date', '-id'
+            ).values_list('id', flat=True)))
+            self.assertEqual(self.client.get(
+                '/api/recipes/', {'limit': 6, 'page': 5}
+            ).status_code, 404)
+            self.assertEqual(self.client.get(
+                '/api/recipes/', {'limit': 6, 'page': 'abc'}
+            ).status_code, 404)
+
+    def test_cursor_pagination_with_relevance_ordering(self):
+        for params in ({'search': 'рецепт'},
+                       {'ingredients': self.ingredient_id}):
+            response = self.client.get('/api/recipes/', params)
+            self.assertEqual(response.status_code, 200, params)
+            response = self.client.get(
+                '/api/recipes/', {'pagination': 'cursor', **params}
+            )
+            self.assertEqual(response.status_code, 400, params)
+            self.assertIn('pagination', response.json())
+        page = self.client.get('/api/recipes/', {
+            'pagination': 'cursor', 'limit': 2,
+        }).json()
+        response = self.client.get(page['next'] + '&search=рецепт')
+        self.assertEqual(response.status_code, 400)
+        # Исключение ингредиентов порядок не меняет.
+        response = self.client.get('/api/recipes/', {
+            'pagination': 'cursor',
+            'exclude_ingredients': self.ingredient_id,
+        })
+        self.assertEqual(response.status_code, 200)
+
+
+@override_settings(MEDIA_ROOT=MEDIA_ROOT)
+class AsyncViewsTest(APITransactionTestCase):
+    """
+    Асинхронные представления режима ASGI отвечают так же, как синхронные.
+    Транзакционный тест: async_view работает с базой из других потоков.
+    """
+
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username='reader', email='reader@foodgram.ru', password='pass'
+        )
+        self.token = Token.objects.create(user=self.user)
+        self.client.credentials(HTTP_AUTHORIZATION=f'Token {self.token}')
+        tag = Tag.objects.create(name='Завтрак', slug='breakfast',
+                                 color='#E26C2D')
+        ingredient = Ingredient.objects.create(name='абрикос',
+                                               measurement_unit='г')
+        self.recipe = Recipe.objects.create(
+            author=self.user, name='Рецепт', text='Описание',
+            cooking_time=10, image='recipes/recipe.png',
+        )
+        self.recipe.tags.add(tag)
+        RecipeIngredient.objects.create(
+            recipe=self.recipe, ingredient=ingredient, amount=100
+        )
+        self.client.post(f'/api/recipes/{self.recipe.id}/shopping_cart/')
+
+    def test_async_views_match_sync(self):
+        views = {
+            str(pattern.pattern): pattern.callback
+            for pattern in async_urlpatterns
+        }
+        factory = AsyncRequestFactory()
+        for route, url, kwargs in (
+            ('tags/', '/api/tags/', {}),
+            ('ingredients/', '/api/ingredients/?name=абр', {}),
+            ('recipes/<pk>/', f'/api/recipes/{self.recipe.id}/',
+             {'pk': str(self.recipe.id)}),
+            ('recipes/download_shopping_cart/',
+             '/api/recipes/download_shopping_cart/', {}),
+        ):
+            expected = self.client.get(url)
+            if expected.streaming:
+                content = b''.join(expected.streaming_content)
+            else:
+                content = expected.content
+            request = factory.get(url, authorization=f'Token {self.token}')
+            response = async_to_sync(views[route])(request, **kwargs)
+            self.assertEqual(response.status_code, 200, url)
+            self.assertEqual(response.content, content, url)
+            self.assertEqual(
+                response['Content-Type'], expected['Content-Type'], url
+            )
+
+    async def asgi_get(self, handler, url):
+        messages = []
+
+        async def receive():
+            return {'type': 'http.request', 'body': b''}
+
+        async def send(message):
+            messages.append(message)
+
+        await handler({
+            'type': 'http',
+            'method': 'GET',
+            'path': url,
+            'query_string': b'',
+            'headers': [
+                (b'host', b'testserver'),
+                (b'authorization', f'Token {self.token}'.encode()),
+            ],
+        }, receive, send)
+        headers = {
+            name.decode().lower(): value.decode()
+            for name, value in messages[0]['headers']
+        }
+        return messages[0]['status'], headers
+
+    @override_settings(
+        ROOT_URLCONF=__name__, METRICS_ENABLED=True, PROFILING_ENABLED=True
+    )
+    def test_asgi_middleware(self):
+        handler = ASGIHandler()
+        # Асинхронное представление и синхронное представление router:
+        # SQL-запросы обоих выполняются в потоках пула.
+        for url, view in (('/api/tags/', 'TagViewSet.list'),
+                          ('/api/recipes/', 'RecipeViewSet.list')):
+            labels = {'view': view}
+            before = REGISTRY.get_sample_value(
+                'foodgram_db_queries_per_request_sum', labels
+            ) or 0
+            status, headers = async_to_sync(self.asgi_get)(handler, url)
+            self.assertEqual(status, 200, url)
+            queries = REGISTRY.get_sample_value(
+                'foodgram_db_queries_per_request_sum', labels
+            ) - before
+            self.assertGreater(queries, 0, url)
+            self.assertIn(
+                f'desc="{queries:.0f} queries', headers['server-timing'], url
+            )
@@ -0,0 +1,80 @@
+import uuid
+
+from django.conf import settings
+from django.core.files.storage import default_storage
+from django.core.files.uploadhandler import (
+    SkipFile,
+    TemporaryFileUploadHandler,
+)
+from PIL import Image
+
+from api.metrics import observe_upload
+
+# Сигнатуры в начале файла и расширения допустимых форматов.
+SIGNATURES = (
+    (b'\xff\xd8\xff', 'jpg'),
+    (b'\x89PNG\r\n\x1a\n', 'png'),
+    (b'GIF87a', 'gif'),
+    (b'GIF89a', 'gif'),
+)
+# Запас на заголовки multipart сверх размера файла.
+MULTIPART_OVERHEAD = 64 * 1024
+
+
+def detect_extension(header):
+    if header[:4] == b'RIFF' and header[8:12] == b'WEBP':
+        return 'webp'
+    for signature, extension in SIGNATURES:
+        if header.startswith(signature):
+            return extension
+    return None
+
+
+class ImageUploadHandler(TemporaryFileUploadHandler):
+    """
+    Пишет загружаемый файл во временный файл по частям и прерывает
+    загрузку, как только превышен размер или не совпал формат.
+    """
+
+    def __init__(self, request=None):
+        super().__init__(request)
+        self.error = None
+        self.extension = None
+
+    def receive_data_chunk(self, raw_data, start):
+        if start == 0:
+            self.extension = detect_extension(raw_data[:12])
+            if self.extension is None:
+                self.error = 'Неподдерживаемый формат изображения'
+                raise SkipFile()
+        if start + len(raw_data) > settings.IMAGE_UPLOAD_MAX_SIZE:
+            self.error = 'Файл слишком большой'
+            raise SkipFile()
+        return super().receive_data_chunk(raw_data, start)
+
+
+def body_too_large(request):
+    """
+    Тело запроса заведомо больше допустимого: такой запрос отклоняется
+    до разбора multipart.
+    """
+    try:
+        content_length = int(request.META.get('CONTENT_LENGTH') or 0)
+    except ValueError:
+        return False
+    return content_length > settings.IMAGE_UPLOAD_MAX_SIZE + MULTIPART_OVERHEAD
+
+
+def save_upload(file, extension):
+    """
+    Проверяет изображение и сохраняет его в хранилище.
+    Возвращает имя файла в хранилище.
+    """
+    try:
+        with Image.open(file) as image:
+            image.verify()
+    except Exception:
+        raise ValueError('Файл не является изображением')
+    file.seek(0)
+    observe_upload('file', file.size)
+    return default_storage.save(f'recipes/{uuid.uuid4()}.{extension}', file)
@@ -1,9 +1,12 @@
 from rest_framework.routers import DefaultRouter
+from django.conf import settings
 from django.urls import include, path
+from api.async_views import async_view
 from api.views import (
     TagViewSet,
     RecipeViewSet,
     IngredientViewSet,
+    ImageUploadView,
     SubscriptionView,
     SubscriptionCollectionView,
 )
@@ -13,10 +16,36 @@ router.register('tags', TagViewSet)
 router.register('recipes', RecipeViewSet)
 router.register('ingredients', IngredientViewSet)
 
+# Частые запросы на чтение в режиме ASGI обрабатываются асинхронно,
+# остальные маршруты router те же.
+async_urlpatterns = (
+    path('tags/', async_view(TagViewSet.as_view(
+        {'get': 'list'}, basename='tag', detail=False
+    ))),
+    path('ingredients/', async_view(IngredientViewSet.as_view(
+        {'get': 'list'}, basename='ingredient', detail=False
+    ))),
+    path('recipes/download_shopping_cart/', async_view(RecipeViewSet.as_view(
+        {'get': 'download_shopping_cart'}, basename='recipe', detail=False
+    ))),
+    path('recipes/<pk>/', async_view(RecipeViewSet.as_view(
+        {
+            'get': 'retrieve',
+            'put': 'update',
+            'patch': 'partial_update',
+            'delete': 'destroy',
+        },
+        basename='recipe',
+        detail=True,
+    ))),
+)
+
 urlpatterns = (
     path('users/subscriptions/', SubscriptionCollectionView.as_view()),
     path('users/<int:id>/subscribe/', SubscriptionView.as_view()),
+    path('recipes/images/', ImageUploadView.as_view()),
     path('', include('djoser.urls')),
     path('auth/', include('djoser.urls.authtoken')),
+    *(async_urlpatterns if settings.SERVER_MODE == 'asgi' else ()),
     path('', include(router.urls)),
 )
@@ -1,18 +1,325 @@
-from collections import Counter
-from .models import RecipeIngredient
+import csv
+import logging
+from io import BytesIO
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.db.models import (
+    Case, Count, F, IntegerField, OuterRef, Subquery, Sum, Value, When
+)
+from django.db.models.functions import Coalesce, Greatest
+from rest_framework import status
+from rest_framework.exceptions import APIException
+
+from .db import iterate
+from .models import (
+    Favorite,
+    Profile,
+    Recipe,
+    RecipeIngredient,
+    ShoppingCartItem,
+    ShoppingListIngredient,
+)
+
+User = get_user_model()
+
+logger = logging.getLogger(__name__)
+
+SHOPPING_CART_TITLE = 'Cписок покупок:'
+EXPORT_CHUNK_SIZE = 2000
+PDF_FONT = 'ShoppingCartFont'
+
+
+class ExportUnavailable(APIException):
+    status_code = status.HTTP_503_SERVICE_UNAVAILABLE
+    default_detail = 'Выгрузка в этом формате временно недоступна'
 
 
 def get_shopping_cart(user):
-    ingredients = RecipeIngredient.objects.filter(
-        recipe__shop_list__user=user.user
+    """
+    Суммарное количество каждого ингредиента из списка покупок.
+    Читается из заранее посчитанной таблицы ShoppingListIngredient.
+    """
+    return ShoppingListIngredient.objects.filter(
+        user=user
+    ).values(
+        'ingredient__name', 'ingredient__measurement_unit'
+    ).annotate(
+        amount_sum=F('amount')
+    ).order_by(
+        'ingredient__name', 'ingredient__measurement_unit'
+    )
+
+
+def update_shopping_lists(user_ids, changes):
+    """
+    Применяет изменения к спискам покупок пользователей.
+    changes: {ingredient_id: (изменение количества, изменение числа
+    рецептов)}.
+    """
+    changes = {
+        ingredient_id: change for ingredient_id, change in changes.items()
+        if change != (0, 0)
+    }
+    if not changes:
+        return
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    with transaction.atomic():
+        ShoppingListIngredient.objects.bulk_create(
+            [ShoppingListIngredient(user_id=user_id, ingredient_id=pk)
+             for user_id in user_ids
+             for pk, (amount, recipes) in changes.items() if recipes > 0],
+            ignore_conflicts=True
+        )
+        ShoppingListIngredient.objects.filter(
+            user_id__in=user_ids,
+            ingredient_id__in=changes,
+        ).update(**{
+            field: Greatest(F(field) + Case(
+                *[When(ingredient_id=pk, then=Value(change[position]))
+                  for pk, change in changes.items()],
+                default=Value(0),
+                output_field=IntegerField(),
+            ), 0)
+            for position, field in enumerate(('amount', 'recipes'))
+        })
+        if any(recipes < 0 for amount, recipes in changes.values()):
+            ShoppingListIngredient.objects.filter(
+                user_id__in=user_ids, recipes=0
+            ).delete()
+
+
+def change_shopping_list(user, recipe_id, sign):
+    """
+    Добавляет (sign=1) или убирает (sign=-1) ингредиенты рецепта
+    из списка покупок пользователя.
+    """
+    update_shopping_lists([user.id], {
+        ingredient_id: (sign * amount, sign)
+        for ingredient_id, amount in RecipeIngredient.objects.filter(
+            recipe_id=recipe_id
+        ).values_list('ingredient_id', 'amount')
+    })
+
+
+def change_recipe_in_shopping_lists(recipe, old, new):
+    """
+    Переносит изменение состава рецепта (old -> new, словари
+    {ingredient_id: amount}) в списки покупок всех, у кого он в корзине.
+    """
+    changes = {}
+    for ingredient_id in old.keys() | new.keys():
+        recipes = (ingredient_id in new) - (ingredient_id in old)
+        changes[ingredient_id] = (
+            new.get(ingredient_id, 0) - old.get(ingredient_id, 0), recipes
+        )
+    update_shopping_lists(
+        ShoppingCartItem.objects.filter(
+            recipe=recipe
+        ).values_list('user_id', flat=True),
+        changes
     )
-    compressed_ingredients = Counter()
-    for ing in ingredients:
-        compressed_ingredients[
-            (ing.ingredient.name, ing.ingredient.measurement_unit)
-        ] += ing.amount
-    return ([
-        f"- {name}: {amount} {measurement_unit}\n"
-        for (name, measurement_unit), amount
-        in compressed_ingredients.items()
-    ])
+
+
+def calculate_shopping_lists(user_ids):
+    """
+    Списки покупок, посчитанные заново по корзинам пользователей:
+    {(user_id, ingredient_id): (количество, число рецептов)}.
+    """
+    rows = ShoppingCartItem.objects.filter(
+        user_id__in=user_ids,
+        recipe__recipeingredient__isnull=False,
+    ).values(
+        'user_id', 'recipe__recipeingredient__ingredient_id'
+    ).annotate(
+        amount=Sum('recipe__recipeingredient__amount'),
+        recipes=Count('recipe_id'),
+    ).order_by()
+    return {
+        (row['user_id'], row['recipe__recipeingredient__ingredient_id']):
+        (row['amount'], row['recipes'])
+        for row in rows
+    }
+
+
+def change_counter(queryset, field, value, **fields):
+    """
+    Атомарно изменяет счётчик field у объектов queryset на value.
+    """
+    return queryset.update(
+        **{field: Greatest(F(field) + value, 0)}, **fields
+    )
+
+
+def change_recipes_count(user, value):
+    if not change_counter(
+        Profile.objects.filter(user=user), 'recipes_count', value
+    ):
+        Profile.objects.get_or_create(
+            user=user,
+            defaults={'recipes_count': user.author_of.count()}
+        )
+
+
+def count_subquery(model, field, outer_field):
+    """
+    Число объектов model, у которых field ссылается на внешний объект.
+    """
+    return Coalesce(Subquery(
+        model.objects.filter(
+            **{field: OuterRef(outer_field)}
+        ).order_by().values(field).annotate(
+            count=Count('pk')
+        ).values('count')
+    ), 0)
+
+
+def recalculate_counters():
+    """
+    Пересчитывает все счётчики по данным связанных таблиц.
+    Возвращает число обновлённых профилей и рецептов.
+    """
+    with transaction.atomic():
+        Profile.objects.bulk_create(
+            [Profile(user_id=pk) for pk in User.objects.filter(
+                profile__isnull=True
+            ).values_list('pk', flat=True)],
+            batch_size=1000,
+            ignore_conflicts=True
+        )
+        profiles = Profile.objects.update(
+            recipes_count=count_subquery(Recipe, 'author', 'user')
+        )
+        recipes = Recipe.objects.update(
+            favorites_count=count_subquery(Favorite, 'recipe', 'pk'),
+            in_carts_count=count_subquery(ShoppingCartItem, 'recipe', 'pk'),
+        )
+    return profiles, recipes
+
+
+def get_recipes_preview(author_ids, limit=None):
+    """
+    Последние рецепты авторов одним запросом: не более limit на автора
+    (ROW_NUMBER по разделам author_id). Возвращает {author_id: [рецепты]}.
+    """
+    author_ids = list(author_ids)
+    previews = {author_id: [] for author_id in author_ids}
+    if not author_ids:
+        return previews
+    if limit is None:
+        recipes = Recipe.objects.filter(
+            author_id__in=author_ids
+        )
+    else:
+        placeholders = ', '.join(['%s'] * len(author_ids))
+        recipes = Recipe.objects.raw(
+            f"""
+            SELECT id, author_id, name, image, image_thumbnail,
+                   cooking_time FROM (
+                SELECT id, author_id, name, image, image_thumbnail,
+                       cooking_time,
+                       ROW_NUMBER() OVER (
+                           PARTITION BY author_id
+                           ORDER BY pub_date DESC, id DESC
+                       ) AS row_number
+                FROM {Recipe._meta.db_table}
+                WHERE author_id IN ({placeholders})
+            ) AS ranked
+            WHERE row_number <= %s
+            ORDER BY author_id, row_number
+            """,
+            [*author_ids, limit]
+        )
+    for recipe in recipes:
+        previews[recipe.author_id].append(recipe)
+    return previews
+
+
+class Echo:
+    """
+    Псевдобуфер для csv.writer: возвращает строку вместо записи.
+    """
+
+    def write(self, value):
+        return value
+
+
+def shopping_cart_txt(ingredients):
+    yield f'{SHOPPING_CART_TITLE}\n'
+    for i in iterate(ingredients, EXPORT_CHUNK_SIZE):
+        yield (
+            f"- {i['ingredient__name']} "
+            f"({i['ingredient__measurement_unit']})"
+            f" - {i['amount_sum']}\n"
+        )
+
+
+def shopping_cart_csv(ingredients):
+    writer = csv.writer(Echo())
+    # BOM нужен, чтобы Excel распознал UTF-8.
+    yield '\ufeff' + writer.writerow(
+        ['Ингредиент', 'Единица измерения', 'Количество']
+    )
+    for i in iterate(ingredients, EXPORT_CHUNK_SIZE):
+        yield writer.writerow([
+            i['ingredient__name'],
+            i['ingredient__measurement_unit'],
+            i['amount_sum'],
+        ])
+
+
+def register_pdf_font():
+    """
+    Регистрирует шрифт PDF_FONT_PATH. Вызывается до создания потокового
+    ответа: ошибка шрифта внутри генератора оборвала бы уже начатый
+    ответ 200.
+    """
+    from reportlab.pdfbase import pdfmetrics
+    from reportlab.pdfbase.ttfonts import TTFError, TTFont
+
+    if PDF_FONT in pdfmetrics.getRegisteredFontNames():
+        return
+    try:
+        pdfmetrics.registerFont(TTFont(PDF_FONT, settings.PDF_FONT_PATH))
+    except (TTFError, OSError):
+        logger.exception('Не удалось загрузить шрифт для PDF')
+        raise ExportUnavailable
+
+
+def shopping_cart_pdf(ingredients):
+    from reportlab.lib.pagesizes import A4
+    from reportlab.pdfgen import canvas
+
+    font = PDF_FONT
+    buffer = BytesIO()
+    pdf = canvas.Canvas(buffer, pagesize=A4)
+    width, height = A4
+    margin, line_height = 50, 18
+    y = height - margin
+    pdf.setFont(font, 16)
+    pdf.drawString(margin, y, SHOPPING_CART_TITLE)
+    pdf.setFont(font, 12)
+    for i in iterate(ingredients, EXPORT_CHUNK_SIZE):
+        y -= line_height
+        if y < margin:
+            pdf.showPage()
+            pdf.setFont(font, 12)
+            y = height - margin
+        pdf.drawString(
+            margin, y,
+            f"- {i['ingredient__name']} "
+            f"({i['ingredient__measurement_unit']}) - {i['amount_sum']}"
+        )
+    pdf.save()
+    buffer.seek(0)
+    yield from iter(lambda: buffer.read(64 * 1024), b'')
+
+
+SHOPPING_CART_EXPORTS = {
+    'txt': ('text/plain; charset=utf-8', shopping_cart_txt),
+    'csv': ('text/csv; charset=utf-8', shopping_cart_csv),
+    'pdf': ('application/pdf', shopping_cart_pdf),
+}
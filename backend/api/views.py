@@ -1,7 +1,8 @@
-import os
-from django.http import HttpResponse
+from django.http import StreamingHttpResponse
 from django.contrib.auth import get_user_model
-from django.db.models import Sum
+from django.db import transaction
+from django.db.models import BooleanField, F, Value
+from django.utils import timezone
 from django.shortcuts import get_object_or_404
 from django_filters.rest_framework import DjangoFilterBackend
 from rest_framework.decorators import action
@@ -11,15 +12,20 @@ from rest_framework.response import Response
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from rest_framework import status
 from rest_framework.exceptions import ValidationError
+from rest_framework.parsers import MultiPartParser
 from rest_framework.views import APIView
 
+from api.autocomplete import ingredient_index
+from api.cache import AnonymousCacheMixin
+from api.etags import ConditionalGetMixin, bump_versions
+from api.images import recipe_files, schedule_file_deletion
 from api.filters import RecipeFilter, IngredientFilter
 from api.models import (
     Tag,
     Recipe,
     Ingredient,
     Favorite,
-    RecipeIngredient,
+    ImageUpload,
     ShoppingCartItem,
     Subscription,
 )
@@ -30,23 +36,52 @@ from api.serializers import (
     IngredientSerializer,
     RecipeReadSerializer,
     UserWithRecipesSerializer,
+    get_recipes_limit,
 )
 from api.permissions import IsAuthorOrReadOnlyPermission
+from api.uploads import ImageUploadHandler, body_too_large, save_upload
+from api.utils import (
+    SHOPPING_CART_EXPORTS,
+    change_counter,
+    change_recipes_count,
+    change_shopping_list,
+    get_recipes_preview,
+    get_shopping_cart,
+    register_pdf_font,
+    update_shopping_lists,
+)
 
 User = get_user_model()
 
 
-class TagViewSet(ReadOnlyModelViewSet):
+class TagViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                 ReadOnlyModelViewSet):
+    cache_namespace = 'tags'
     queryset = Tag.objects.all()
     serializer_class = TagSerializer
     pagination_class = None
 
 
-class RecipeViewSet(ModelViewSet):
+class RecipeViewSet(ConditionalGetMixin, AnonymousCacheMixin, ModelViewSet):
+    cache_namespace = 'recipes'
+    user_dependent = True
     queryset = Recipe.objects.all()
     serializer_class = RecipeReadSerializer
     filter_backends = [DjangoFilterBackend]
     filterset_class = RecipeFilter
+    cursor_ordering = ('-pub_date', '-id')
+
+    def get_queryset(self):
+        if self.action in ['list', 'retrieve']:
+            return Recipe.objects.for_read().order_by(*self.cursor_ordering)
+        return super().get_queryset()
+
+    def get_serializer_context(self):
+        context = super().get_serializer_context()
+        context['image_rendition'] = (
+            'medium' if self.action == 'list' else 'full'
+        )
+        return context
 
     def get_serializer_class(self):
         if self.action in ['create', 'update', 'partial_update']:
@@ -63,25 +98,53 @@ class RecipeViewSet(ModelViewSet):
             permission_classes = [AllowAny]
         return [permission() for permission in permission_classes]
 
+    @transaction.atomic
     def perform_create(self, serializer):
         serializer.save(author=self.request.user)
+        change_recipes_count(self.request.user, 1)
 
     def perform_destroy(self, instance):
-        os.unlink(instance.image.path)
-        instance.delete()
+        with transaction.atomic():
+            schedule_file_deletion(recipe_files(instance))
+            update_shopping_lists(
+                instance.added_to_shopping_cart_by.values_list(
+                    'user_id', flat=True
+                ),
+                {
+                    ingredient_id: (-amount, -1)
+                    for ingredient_id, amount in
+                    instance.recipeingredient_set.values_list(
+                        'ingredient_id', 'amount'
+                    )
+                }
+            )
+            instance.delete()
+            change_recipes_count(instance.author, -1)
 
-    def add_related_object(self, model, user, pk):
+    @transaction.atomic
+    def add_related_object(self, model, user, pk, counter):
         if model.objects.filter(user=user, recipe__id=pk).exists():
             raise ValidationError('Рецепт уже существует')
         recipe = get_object_or_404(Recipe, id=pk)
         model.objects.create(user=user, recipe=recipe)
+        change_counter(
+            Recipe.objects.filter(pk=pk), counter, 1,
+            updated_at=timezone.now()
+        )
+        bump_versions('recipes')
         serializer = ShortRecipeSerializer(recipe)
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
-    def delete_related_object(self, model, user, pk):
+    @transaction.atomic
+    def delete_related_object(self, model, user, pk, counter):
         obj = model.objects.filter(user=user, recipe__id=pk)
         if obj.exists():
             obj.delete()
+            change_counter(
+                Recipe.objects.filter(pk=pk), counter, -1,
+                updated_at=timezone.now()
+            )
+            bump_versions('recipes')
             return Response(status=status.HTTP_204_NO_CONTENT)
         raise ValidationError('Рецепта не существует')
 
@@ -93,9 +156,13 @@ class RecipeViewSet(ModelViewSet):
     )
     def favorite(self, request, pk):
         if request.method == 'POST':
-            return self.add_related_object(Favorite, request.user, pk)
+            return self.add_related_object(
+                Favorite, request.user, pk, 'favorites_count'
+            )
         elif request.method == 'DELETE':
-            return self.delete_related_object(Favorite, request.user, pk)
+            return self.delete_related_object(
+                Favorite, request.user, pk, 'favorites_count'
+            )
 
     @action(
         detail=True,
@@ -104,14 +171,24 @@ class RecipeViewSet(ModelViewSet):
 
     )
     def shopping_cart(self, request, pk):
-        if request.method == 'POST':
-            return self.add_related_object(ShoppingCartItem, request.user, pk)
-        elif request.method == 'DELETE':
-            return self.delete_related_object(
-                ShoppingCartItem,
-                request.user,
-                pk
-            )
+        with transaction.atomic():
+            if request.method == 'POST':
+                response = self.add_related_object(
+                    ShoppingCartItem,
+                    request.user,
+                    pk,
+                    'in_carts_count'
+                )
+                change_shopping_list(request.user, pk, 1)
+            elif request.method == 'DELETE':
+                response = self.delete_related_object(
+                    ShoppingCartItem,
+                    request.user,
+                    pk,
+                    'in_carts_count'
+                )
+                change_shopping_list(request.user, pk, -1)
+        return response
 
     @action(
         detail=False,
@@ -120,37 +197,91 @@ class RecipeViewSet(ModelViewSet):
         permission_classes=[IsAuthenticated]
     )
     def download_shopping_cart(self, request):
-        output = 'Cписок покупок:\n'
-        ingredients = RecipeIngredient.objects.filter(
-            recipe__added_to_shopping_cart_by__user=request.user
-        ).values(
-            'ingredient__name', 'ingredient__measurement_unit'
-        ).annotate(
-            amount_sum=Sum('amount')
-        )
-        for i in ingredients:
-            output += (
-                f"- {i['ingredient__name']} "
-                f"({i['ingredient__measurement_unit']})"
-                f" - {i['amount_sum']}\n"
+        file_format = request.query_params.get('file_format', 'txt')
+        if file_format not in SHOPPING_CART_EXPORTS:
+            raise ValidationError(
+                f'Доступные форматы: {", ".join(SHOPPING_CART_EXPORTS)}'
             )
-        return HttpResponse(output, content_type='text/plain', headers={
-            'Content-Disposition': 'attachment; filename="shopping_cart.txt"'
-        })
+        content_type, export = SHOPPING_CART_EXPORTS[file_format]
+        if file_format == 'pdf':
+            register_pdf_font()
+        response = StreamingHttpResponse(
+            export(get_shopping_cart(request.user)),
+            content_type=content_type
+        )
+        response['Content-Disposition'] = (
+            f'attachment; filename="shopping_cart.{file_format}"'
+        )
+        return response
+
+
+class ImageUploadView(APIView):
+    """
+    Загрузка изображения рецепта файлом (multipart/form-data, поле image).
+    Возвращает токен, который передаётся в image_token при создании
+    или изменении рецепта вместо base64.
+    """
+    permission_classes = [IsAuthenticated]
+    parser_classes = [MultiPartParser]
+
+    def post(self, request):
+        if body_too_large(request):
+            raise ValidationError({'image': 'Файл слишком большой'})
+        handler = ImageUploadHandler(request._request)
+        request._request.upload_handlers = [handler]
+        file = request.FILES.get('image')
+        if handler.error:
+            raise ValidationError({'image': handler.error})
+        if file is None:
+            raise ValidationError({'image': 'Файл не передан'})
+        try:
+            name = save_upload(file, handler.extension)
+        except ValueError as error:
+            raise ValidationError({'image': str(error)})
+        finally:
+            file.close()
+        upload = ImageUpload.objects.create(user=request.user, image=name)
+        return Response(
+            {
+                'token': upload.token,
+                'image': request.build_absolute_uri(upload.image.url),
+            },
+            status=status.HTTP_201_CREATED
+        )
 
 
 class SubscriptionCollectionView(ListAPIView):
     permission_classes = [IsAuthenticated]
     serializer_class = UserWithRecipesSerializer
+    cursor_ordering = ('-subscription_id',)
 
     def get_queryset(self):
-        return User.objects.filter(followers__user=self.request.user)
+        return User.objects.filter(
+            followers__user=self.request.user
+        ).annotate(
+            is_subscribed=Value(True, output_field=BooleanField()),
+            subscription_id=F('followers__id'),
+        ).select_related('profile').order_by(*self.cursor_ordering)
+
+    def list(self, request, *args, **kwargs):
+        recipes_limit = get_recipes_limit(request)
+        page = self.paginate_queryset(self.get_queryset())
+        context = self.get_serializer_context()
+        context['recipes'] = get_recipes_preview(
+            [author.id for author in page], recipes_limit
+        )
+        serializer = self.get_serializer(page, many=True, context=context)
+        return self.get_paginated_response(serializer.data)
 
 
 class SubscriptionView(APIView):
     permission_classes = [IsAuthenticated]
 
+    @transaction.atomic
     def post(self, request, id):
+        # Параметры проверяются до записи: ошибка в recipes_limit
+        # не должна оставлять подписку.
+        recipes_limit = get_recipes_limit(request)
         author = get_object_or_404(User, pk=id)
         if author == request.user:
             raise ValidationError('Нельзя подписаться на себя')
@@ -162,7 +293,10 @@ class SubscriptionView(APIView):
         Subscription.objects.create(user=request.user, author=author)
         serializer = UserWithRecipesSerializer(
             author,
-            context={'request': request}
+            context={
+                'request': request,
+                'recipes': get_recipes_preview([author.id], recipes_limit),
+            }
         )
         return Response(serializer.data, status=status.HTTP_201_CREATED)
 
@@ -178,9 +312,25 @@ class SubscriptionView(APIView):
         raise ValidationError('Подписки не существует')
 
 
-class IngredientViewSet(ReadOnlyModelViewSet):
+class IngredientViewSet(ConditionalGetMixin, AnonymousCacheMixin,
+                        ReadOnlyModelViewSet):
+    cache_namespace = 'ingredients'
     queryset = Ingredient.objects.all()
     serializer_class = IngredientSerializer
     pagination_class = None
     filter_backends = [DjangoFilterBackend]
     filterset_class = IngredientFilter
+
+    def list(self, request, *args, **kwargs):
+        self.validator_state = self.get_validator_state()
+        return self.conditional(
+            self.search, self.validator_state, request, *args, **kwargs
+        )
+
+    def search(self, request, *args, **kwargs):
+        name = request.query_params.get('name')
+        if name:
+            # Версия данных для ETag — это и версия индекса.
+            version, = self.validator_state
+            return Response(ingredient_index.search(name, version=version))
+        return AnonymousCacheMixin.list(self, request, *args, **kwargs)
@@ -40,6 +40,8 @@ INSTALLED_APPS = [
 ]
 
 MIDDLEWARE = [
+    'api.metrics.MetricsMiddleware',
+    'api.profiling.ProfilingMiddleware',
     'django.middleware.security.SecurityMiddleware',
     'django.contrib.sessions.middleware.SessionMiddleware',
     'django.middleware.common.CommonMiddleware',
@@ -73,17 +75,54 @@ WSGI_APPLICATION = 'foodgram.wsgi.application'
 # Database
 # https://docs.djangoproject.com/en/3.2/ref/settings/#databases
 
+# DB_CONN_MAX_AGE — время жизни постоянного соединения, сек. (0 — новое
+# соединение на каждый запрос, none — без ограничения).
+# DB_POOL_MODE=pgbouncer — подключение через pgbouncer в режиме
+# transaction: серверные курсоры отключаются, потоковые выгрузки читают
+# данные частями (api.db.iterate).
+
+DB_CONN_MAX_AGE = os.getenv('DB_CONN_MAX_AGE', '60')
+DB_POOL_MODE = os.getenv('DB_POOL_MODE', '')
+
 DATABASES = {
     'default': {
-        'ENGINE': 'django.db.backends.postgresql',
+        'ENGINE': os.getenv('DB_ENGINE', 'django.db.backends.postgresql'),
         'NAME': os.getenv('POSTGRES_DB', 'django'),
         'USER': os.getenv('POSTGRES_USER', 'django'),
         'PASSWORD': os.getenv('POSTGRES_PASSWORD', ''),
         'HOST': os.getenv('DB_HOST', ''),
-        'PORT': os.getenv('DB_PORT', 5432)
+        'PORT': os.getenv('DB_PORT', 5432),
+        'CONN_MAX_AGE': (
+            None if DB_CONN_MAX_AGE.lower() == 'none'
+            else int(DB_CONN_MAX_AGE)
+        ),
+        'DISABLE_SERVER_SIDE_CURSORS': DB_POOL_MODE == 'pgbouncer',
     }
 }
 
+# Постоянное соединение, простаивавшее дольше этого времени (сек.),
+# перед запросом проверяется (SELECT 1) и при обрыве переоткрывается
+DB_HEALTH_CHECK_IDLE = int(os.getenv('DB_HEALTH_CHECK_IDLE', 10))
+
+
+# Cache
+# https://docs.djangoproject.com/en/3.2/topics/cache/
+# В продакшене: django.core.cache.backends.filebased.FileBasedCache
+# с каталогом в CACHE_LOCATION или Redis-бэкенд (например,
+# django_redis.cache.RedisCache) с адресом сервера.
+
+CACHES = {
+    'default': {
+        'BACKEND': os.getenv(
+            'CACHE_BACKEND', 'django.core.cache.backends.locmem.LocMemCache'
+        ),
+        'LOCATION': os.getenv('CACHE_LOCATION', ''),
+    }
+}
+
+# Время жизни закэшированных ответов для анонимных пользователей, сек.
+RESPONSE_CACHE_TIMEOUT = int(os.getenv('RESPONSE_CACHE_TIMEOUT', 300))
+
 
 # Password validation
 # https://docs.djangoproject.com/en/3.2/ref/settings/#auth-password-validators
@@ -132,6 +171,50 @@ MEDIA_ROOT = BASE_DIR / 'media'
 
 DEFAULT_AUTO_FIELD = 'django.db.models.BigAutoField'
 
+# Максимальное число ингредиентов в ответе автодополнения
+INGREDIENT_SEARCH_LIMIT = int(os.getenv('INGREDIENT_SEARCH_LIMIT', 50))
+
+# Потоки для обработки изображений рецептов (0 — в текущем потоке)
+IMAGE_PROCESSING_WORKERS = int(os.getenv('IMAGE_PROCESSING_WORKERS', 2))
+
+# Максимальный размер изображения, загружаемого файлом, байт
+IMAGE_UPLOAD_MAX_SIZE = int(
+    os.getenv('IMAGE_UPLOAD_MAX_SIZE', 10 * 1024 * 1024)
+)
+
+# Начиная с этого числа объектов count в постраничных ответах
+# приблизительный: оценка планировщика PostgreSQL или кэш точного значения
+PAGINATION_ESTIMATE_THRESHOLD = int(
+    os.getenv('PAGINATION_ESTIMATE_THRESHOLD', 10000)
+)
+
+# Время жизни закэшированного count, сек.
+PAGINATION_COUNT_CACHE_TIMEOUT = int(
+    os.getenv('PAGINATION_COUNT_CACHE_TIMEOUT', 60)
+)
+
+# Профилирование запросов (заголовок Server-Timing и отчёт
+# profiling_report) и число последних запросов маршрута в отчёте
+PROFILING_ENABLED = os.getenv('PROFILING_ENABLED', '').lower() in (
+    '1', 'true', 'yes'
+)
+PROFILING_WINDOW = int(os.getenv('PROFILING_WINDOW', 1000))
+
+# wsgi — gunicorn с синхронными процессами, asgi — с процессами uvicorn
+# и асинхронными представлениями для частых запросов (см. gunicorn.conf.py)
+SERVER_MODE = os.getenv('SERVER_MODE', 'wsgi')
+
+# Метрики Prometheus на /metrics. Для нескольких процессов gunicorn
+# задайте PROMETHEUS_MULTIPROC_DIR (см. gunicorn.conf.py)
+METRICS_ENABLED = os.getenv('METRICS_ENABLED', '').lower() in (
+    '1', 'true', 'yes'
+)
+
+# TTF-шрифт с кириллицей для выгрузки списка покупок в PDF
+PDF_FONT_PATH = os.getenv(
+    'PDF_FONT_PATH', '/usr/share/fonts/truetype/dejavu/DejaVuSans.ttf'
+)
+
 DJOSER = {
     'HIDE_USERS': False,
     'LOGIN_FIELD': 'email',
@@ -0,0 +1,26 @@
+import os
+import shutil
+
+# Загружается gunicorn автоматически из рабочего каталога.
+bind = '0.0.0.0:8000'
+
+if os.getenv('SERVER_MODE') == 'asgi':
+    wsgi_app = 'foodgram.asgi:application'
+    worker_class = 'uvicorn.workers.UvicornWorker'
+else:
+    wsgi_app = 'foodgram.wsgi:application'
+
+
+def on_starting(server):
+    # Файлы метрик прошлого запуска иначе попадут в суммы счётчиков.
+    directory = os.getenv('PROMETHEUS_MULTIPROC_DIR')
+    if directory:
+        shutil.rmtree(directory, ignore_errors=True)
+        os.makedirs(directory)
+
+
+def child_exit(server, worker):
+    if os.getenv('PROMETHEUS_MULTIPROC_DIR'):
+        from prometheus_client import multiprocess
+
+        multiprocess.mark_process_dead(worker.pid)